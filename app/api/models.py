@@ -1,11 +1,37 @@
 from pydantic import BaseModel
 from typing import List, Optional
+from datetime import datetime
 
 class MessageSend(BaseModel):
     phone_number: str
     message: str
     image_path: Optional[str] = None
+    send_at: Optional[datetime] = None # Scheduled send (ISO 8601 or epoch). None = as soon as possible
 
 class MessageRead(BaseModel):
+    id: Optional[str] = None # WhatsApp data-id, used as the cursor
+    from_me: bool = False
     meta: Optional[str] = None
     content: str
+
+class MessagePage(BaseModel):
+    messages: List[MessageRead]
+    cursor: Optional[str] = None # Pass as "after" to get the next messages
+    has_more: bool = False
+    cursor_found: bool = True # False if "after" is no longer in the loaded history
+
+class QueueItem(BaseModel):
+    id: int
+    phone: str
+    message: str
+    image_path: Optional[str] = None
+    status: str
+    created_at: Optional[float] = None
+    send_at: Optional[float] = None
+    processed_at: Optional[float] = None
+    error_msg: Optional[str] = None
+    delivery_state: Optional[str] = None
+
+class QueuePage(BaseModel):
+    items: List[QueueItem]
+    next_cursor: Optional[str] = None # Pass as "cursor" to get the next (older) page
@@ -1,17 +1,38 @@
-from fastapi import APIRouter, HTTPException
-from app.services.whatsapp import service
-from app.api.models import MessageSend
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from typing import Optional
+from app.services.whatsapp import service, InvalidNumberError
+from app.supervisor import supervisor
+from app.core import config
+from app.services.queue_manager import queue_manager
+from app.services.intake import enqueue_message, normalize_phone
+from app.services.jobs import job_waiter, FINAL_STATUSES
+from app.api.models import MessageSend, MessagePage, QueueItem, QueuePage
 import asyncio
+import json
 
 router = APIRouter()
 
 @router.get("/status")
 async def get_status():
+    if config.SUPERVISOR:
+        return {"status": supervisor.get_status(), "workers": supervisor.snapshot()}
     status = await service.get_status()
     return {"status": status}
 
 @router.get("/qr")
 async def get_qr():
+    if config.SUPERVISOR:
+        status = supervisor.get_status()
+        if status == "connected":
+            return {"status": "connected", "qr": None}
+        # The page belongs to a worker process, which publishes its QR as a file
+        worker_id, qr_base64 = supervisor.get_qr()
+        if not qr_base64:
+            raise HTTPException(status_code=404, detail="QR Code not found (yet)")
+        return {"status": "waiting_qr", "qr_base64": qr_base64, "worker_id": worker_id}
+
     status = await service.get_status()
     if status == "connected":
         return {"status": "connected", "qr": None}
@@ -22,9 +43,161 @@ async def get_qr():
     
     return {"status": "waiting_qr", "qr_base64": qr_base64}
 
-@router.post("/send")
-async def send_message(payload: MessageSend):
-    success = await service.send_message(payload.phone_number, payload.message, payload.image_path)
-    if not success:
-        raise HTTPException(status_code=500, detail="Failed to send message")
-    return {"status": "sent", "to": payload.phone_number}
+# HTTP status for each intake rejection reason
+REJECT_STATUS = {
+    "invalid": 400,
+    "duplicate": 409,
+    "invalid_number": 422,
+    "error": 500,
+}
+
+def _job_view(row):
+    return {
+        "job_id": row["id"],
+        "status": row["status"],
+        "done": row["status"] in FINAL_STATUSES,
+        "to": row["phone"],
+        "delivery_state": row.get("delivery_state"),
+        "error": row.get("error_msg"),
+        "created_at": row.get("created_at"),
+        "send_at": row.get("send_at"),
+        "processed_at": row.get("processed_at"),
+    }
+
+async def _job_status(job_id, wait):
+    row = await run_in_threadpool(queue_manager.get_message, job_id)
+    if not row:
+        raise HTTPException(status_code=404, detail="Job no encontrado")
+    if wait > 0 and row["status"] not in FINAL_STATUSES:
+        if await job_waiter.wait(job_id, timeout=wait):
+            row = await run_in_threadpool(queue_manager.get_message, job_id)
+    return _job_view(row)
+
+@router.post("/send", status_code=202)
+async def send_message(payload: MessageSend, wait: float = Query(0, ge=0, le=60)):
+    """
+    Enqueue a message (same serialized, throttled, deduplicated path as the socket) and return its job id.
+    wait: optionally long-poll up to N seconds for the result before answering.
+    """
+    ack = await enqueue_message(payload.phone_number, payload.message, payload.image_path, payload.send_at)
+    if ack["status"] == "rejected":
+        raise HTTPException(status_code=REJECT_STATUS.get(ack["reason"], 400), detail=ack)
+    return await _job_status(ack["id"], wait)
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: int, wait: float = Query(0, ge=0, le=60)):
+    """Job status. With wait > 0, holds the request until the job finishes or the timeout expires (long-polling)."""
+    return await _job_status(job_id, wait)
+
+# Max seconds between SSE polls while the sender is busy with the queue
+STREAM_MAX_BACKOFF = 60
+
+def _chat_phone(phone):
+    """Same digit check as intake, before the browser is touched (or the number cached as invalid)."""
+    normalized = normalize_phone(phone)
+    if not normalized:
+        raise HTTPException(status_code=400, detail="phone debe ser numerico")
+    return normalized
+
+def _sender_busy():
+    """True while the queue has work: a chat switch would reload the page under the sender."""
+    counters = queue_manager.get_counters()
+    return counters.get('PENDING', 0) > 0 or counters.get('PROCESSING', 0) > 0
+
+async def _read_chat(phone, after, limit):
+    if config.SUPERVISOR:
+        raise HTTPException(status_code=503, detail="Lectura de chats no disponible en modo supervisor")
+    if queue_manager.is_invalid_number(phone):
+        raise HTTPException(status_code=422, detail="Numero no registrado en WhatsApp")
+    try:
+        return await service.get_messages(phone, after=after, limit=limit)
+    except InvalidNumberError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error leyendo chat: {e}")
+
+@router.get("/messages/{phone}", response_model=MessagePage)
+async def read_messages(phone: str, after: Optional[str] = None, limit: int = Query(50, ge=1, le=500)):
+    """Messages after the `after` cursor (or the latest `limit`). Follow `cursor` to paginate."""
+    return await _read_chat(_chat_phone(phone), after, limit)
+
+@router.get("/messages/{phone}/stream")
+async def stream_messages(phone: str, after: Optional[str] = None, interval: float = Query(5, ge=1, le=60)):
+    """
+    Server-Sent Events: one event per new message in the chat.
+    Without `after`, starts from the current last message (only new ones are sent).
+    Polls are skipped (with backoff) while the queue has PENDING/PROCESSING rows, so the
+    stream never reopens its chat under the sender. Ends with an "error" event if the
+    cursor disappears from the chat (instead of replaying the whole chat).
+    """
+    phone = _chat_phone(phone)
+    if after is None:
+        latest = await _read_chat(phone, None, 1)
+        after = latest["cursor"]
+    else:
+        first = await _read_chat(phone, after, 1) # Validate before opening the stream
+        if not first["cursor_found"]:
+            raise HTTPException(status_code=404, detail="Cursor no encontrado en el chat")
+
+    async def events():
+        cursor = after
+        delay = interval
+        while True:
+            if _sender_busy():
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, STREAM_MAX_BACKOFF)
+                continue
+            delay = interval
+            try:
+                page = await service.get_messages(phone, after=cursor, limit=500)
+            except Exception as e:
+                yield f"event: error\ndata: {json.dumps({'detail': str(e)})}\n\n"
+                return
+            if cursor and not page["cursor_found"]:
+                yield f"event: error\ndata: {json.dumps({'detail': 'Cursor no encontrado en el chat', 'cursor': cursor})}\n\n"
+                return
+            for msg in page["messages"]:
+                yield f"id: {msg['id']}\ndata: {json.dumps(msg, ensure_ascii=False)}\n\n"
+            cursor = page["cursor"]
+            if not page["has_more"]:
+                await asyncio.sleep(interval)
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+# Queue inspection: plain "def" endpoints run in the threadpool, SQLite never blocks the event loop
+
+@router.get("/queue", response_model=QueuePage)
+def list_queue(
+    status: Optional[str] = None,
+    phone: Optional[str] = None,
+    since: Optional[float] = None,
+    until: Optional[float] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=500),
+):
+    """Queue rows, newest first. Filters: status, phone, created_at range (epoch). Keyset pagination via `cursor`."""
+    keyset = None
+    if cursor:
+        try:
+            created_at, msg_id = cursor.split(":", 1)
+            keyset = (float(created_at), int(msg_id))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Cursor invalido")
+
+    rows, next_keyset = queue_manager.list_messages(
+        status=status.upper() if status else None, phone=phone, since=since, until=until, cursor=keyset, limit=limit
+    )
+    next_cursor = f"{next_keyset[0]!r}:{next_keyset[1]}" if next_keyset else None
+    return {"items": rows, "next_cursor": next_cursor}
+
+@router.get("/queue/counters")
+def queue_counters():
+    """Rows per status (constant time, kept up to date on every state change)."""
+    return queue_manager.get_counters()
+
+@router.get("/queue/{msg_id}", response_model=QueueItem)
+def get_queue_item(msg_id: int):
+    row = queue_manager.get_message(msg_id)
+    if not row:
+        raise HTTPException(status_code=404, detail="Mensaje no encontrado")
+    return row
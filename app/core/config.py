@@ -12,8 +12,6 @@ if getattr(sys, 'frozen', False):
 else:
     EXEC_DIR = BASE_DIR
 
-print(EXEC_DIR)
-
 # Config Parser
 config_file = EXEC_DIR / "config.ini"
 ini_config = configparser.ConfigParser()
@@ -42,9 +40,42 @@ RUC = get_config("General", "RUC", "10203040500")
 # Auth Token
 TOKEN = get_config("General", "TOKEN", "no_token")
 
-# Similarity Threshold (0-100). Default 90. 0 = Disabled.
+# Similarity Threshold (0-100): % of 4-char shingles shared (Jaccard). Default 90. 100 = exact only, 0 = Disabled.
 SIMILARITY_THRESHOLD = int(get_config("General", "SIMILARITY_THRESHOLD", "90"))
 
+# Queue stats report interval in seconds (backpressure info for the Socket Server). 0 = Disabled.
+STATS_INTERVAL = int(get_config("General", "STATS_INTERVAL", "15"))
+
+# Max seconds to wait for the sent tick (clock -> check) after pressing send
+SEND_CONFIRM_TIMEOUT = int(get_config("General", "SEND_CONFIRM_TIMEOUT", "30"))
+
+# Merge text-only messages to the same phone queued within this many seconds into one. 0 = Disabled.
+COALESCE_WINDOW = int(get_config("General", "COALESCE_WINDOW", "0"))
+
+# Seconds a number detected as "not on WhatsApp" is rejected without opening the browser. 0 = Disabled.
+INVALID_NUMBER_TTL = int(get_config("General", "INVALID_NUMBER_TTL", "86400"))
+
+# Supervisor mode: intake (API + Socket.IO) in this process, browser senders in child processes
+SUPERVISOR = get_config("Supervisor", "ENABLED", "False").lower() == "true"
+# Number of sender worker processes (each one needs its own WhatsApp session)
+SENDER_WORKERS = int(get_config("Supervisor", "WORKERS", "1"))
+# Seconds without a heartbeat before a worker is considered hung and restarted
+WORKER_HANG_TIMEOUT = int(get_config("Supervisor", "HANG_TIMEOUT", "300"))
+
+# Seconds between status outbox flushes to the Socket Server (per-message SENT/ERROR/DUPLICATE)
+OUTBOX_FLUSH_INTERVAL = float(get_config("General", "OUTBOX_FLUSH_INTERVAL", "2"))
+# Max status events per emit
+OUTBOX_BATCH_SIZE = int(get_config("General", "OUTBOX_BATCH_SIZE", "100"))
+
+# Write-behind for socket bursts: flush buffered messages every N ms or every MAX_ROWS rows (one commit per group). 0 = Disabled.
+WRITE_BEHIND_MS = int(get_config("General", "WRITE_BEHIND_MS", "5"))
+WRITE_BEHIND_MAX_ROWS = int(get_config("General", "WRITE_BEHIND_MAX_ROWS", "200"))
+
+# Logging: level (DEBUG, INFO, WARNING, ERROR) and rotating file size/count (logs/ folder)
+LOG_LEVEL = get_config("Logging", "LEVEL", "INFO")
+LOG_MAX_BYTES = int(get_config("Logging", "MAX_BYTES", str(5 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(get_config("Logging", "BACKUP_COUNT", "5"))
+
 # Socket URL (Socket Server)
 SOCKET_URL = get_config("General", "SOCKET_URL", "http://jsjperu.net:8000")
 
@@ -0,0 +1,97 @@
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+
+from app.core import config
+
+# Non-blocking logging: callers only put records on a queue, a background
+# listener thread formats them and writes to the console and a rotating file.
+
+LOG_FORMAT = "%(asctime)s %(levelname)-7s [%(name)s] %(message)s"
+
+_listener = None
+
+
+class SafeStreamHandler(logging.StreamHandler):
+    """Console handler that never fails on characters the console can't encode (e.g. emoji on cp1252)."""
+
+    def emit(self, record):
+        try:
+            msg = self.format(record)
+            encoding = getattr(self.stream, "encoding", None) or "utf-8"
+            msg = msg.encode(encoding, errors="replace").decode(encoding, errors="replace")
+            self.stream.write(msg + self.terminator)
+            self.flush()
+        except Exception:
+            self.handleError(record)
+
+
+def _log_dir():
+    # Same fallback order as the database: exe folder, then AppData
+    candidates = [config.EXEC_DIR / "logs"]
+    for env in ("LOCALAPPDATA", "APPDATA"):
+        if os.getenv(env):
+            candidates.append(os.path.join(os.getenv(env), "ControlWHA", "logs"))
+    for candidate in candidates:
+        try:
+            os.makedirs(candidate, exist_ok=True)
+            if os.access(candidate, os.W_OK):
+                return str(candidate)
+        except OSError:
+            continue
+    return None
+
+
+def setup_logging(filename="control-wha.log"):
+    """
+    Configure the root logger once per process.
+    filename: rotating log file (each process needs its own, Windows can't rotate a shared one).
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    level = getattr(logging, config.LOG_LEVEL.upper(), logging.INFO)
+    formatter = logging.Formatter(LOG_FORMAT)
+
+    console = SafeStreamHandler(sys.stdout)
+    console.setFormatter(formatter)
+    handlers = [console]
+
+    log_dir = _log_dir()
+    if log_dir:
+        file_handler = logging.handlers.RotatingFileHandler(
+            os.path.join(log_dir, filename),
+            maxBytes=config.LOG_MAX_BYTES,
+            backupCount=config.LOG_BACKUP_COUNT,
+            encoding="utf-8",
+        )
+        file_handler.setFormatter(formatter)
+        handlers.append(file_handler)
+
+    log_queue = queue.Queue(-1)
+    root = logging.getLogger()
+    root.handlers = [logging.handlers.QueueHandler(log_queue)]
+    root.setLevel(level)
+
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+    # Folder where config.ini and messages.sqlite are looked up first
+    logging.getLogger(__name__).info(f"📂 Carpeta de ejecución: {config.EXEC_DIR}")
+
+
+def stop_logging():
+    """Drain pending records (called at exit)."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def get_logger(name):
+    return logging.getLogger(name)
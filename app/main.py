@@ -6,10 +6,20 @@ import socketio
 if sys.platform == 'win32':
     asyncio.set_event_loop_policy(asyncio.WindowsProactorEventLoopPolicy())
 
+# Logging first: services log while they initialize on import
+from app.core.log import get_logger, setup_logging
+setup_logging()
+logger = get_logger(__name__)
+
 from fastapi import FastAPI
 from fastapi.responses import HTMLResponse
 from app.api.routes import router
 from app.services.whatsapp import service
+from app.supervisor import supervisor
+from app.services.scheduler import scheduler
+from app.services.intake import enqueue_message
+from app.services.jobs import job_waiter
+from app.services.write_behind import write_buffer
 
 from app.core import config
 
@@ -18,39 +28,88 @@ sio = socketio.AsyncClient()
 
 @sio.event
 async def connect():
-    print("Conectado al Socket Server (Node.js)")
+    logger.info("Conectado al Socket Server (Node.js)")
     if config.RUC:
-        print(f"Registrando RUC: {config.RUC}")
+        logger.info(f"Registrando RUC: {config.RUC}")
         await sio.emit('register', {'ruc': config.RUC})
     else:
-        print("⚠️ No se configuro RUC. El servidor no podra enviar mensajes a este cliente especifico.")
+        logger.warning("⚠️ No se configuro RUC. El servidor no podra enviar mensajes a este cliente especifico.")
 
 @sio.event
 async def connect_error(data):
-    print(f"Error de conexion Socket.IO: {data}")
+    logger.error(f"Error de conexion Socket.IO: {data}")
 
 @sio.event
 async def disconnect():
-    print("Desconectado del Socket Server")
+    logger.info("Desconectado del Socket Server")
 
 @sio.on('enviar_whatsapp')
 async def on_mensaje(data):
     """
     Evento recibido desde el servidor Node.js.
-    Data esperada: { "phone_number": "...", "message": "...", "image_path": "..." }
+    Data esperada: { "phone_number": "...", "message": "...", "image_path": "...", "send_at": "..." (opcional) }
+    Retorna el ACK para el servidor: { "status": "queued"|"scheduled", "id": ... } o { "status": "rejected", "reason": ... }
     """
-    print(f"📩 Evento recibido: enviar_whatsapp -> {data}")
-    phone = data.get('phone_number')
-    message = data.get('message')
-    image_path = data.get('image_path')
-    
-    if phone and message:
-        print(f"📥 Encolando mensaje para {phone}...")
-        # Import dynamically to avoid circular imports if any (though unlikely here)
-        from app.services.queue_manager import queue_manager
-        queue_manager.add_message(phone, message, image_path)
-    else:
-        print("⚠️ Datos incompletos en el evento (Falta phone o message)")
+    logger.info(f"📩 Evento recibido: enviar_whatsapp -> {data}")
+
+    if not isinstance(data, dict):
+        logger.warning("⚠️ Evento con formato invalido")
+        return {'status': 'rejected', 'reason': 'invalid', 'detail': 'Payload no es un objeto'}
+
+    return await enqueue_message(data.get('phone_number'), data.get('message'), data.get('image_path'), data.get('send_at'))
+
+# Wakes the outbox flusher right away (e.g. after reconnecting)
+outbox_wakeup = asyncio.Event()
+
+async def flush_status_outbox():
+    """
+    Send per-message status events (SENT/ERROR/DUPLICATE) upstream in batches.
+    Events stay in the local outbox until the server ACKs them, so after a
+    disconnection they are replayed in order.
+    """
+    from app.services.queue_manager import queue_manager
+
+    while True:
+        try:
+            await asyncio.wait_for(outbox_wakeup.wait(), timeout=config.OUTBOX_FLUSH_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+        outbox_wakeup.clear()
+
+        while sio.connected:
+            try:
+                events = queue_manager.get_outbox(config.OUTBOX_BATCH_SIZE)
+                if not events:
+                    break
+                for event in events:
+                    started_at = event['send_at'] or event['created_at']
+                    event['queue_seconds'] = round(event['processed_at'] - started_at, 2) if event['processed_at'] and started_at else None
+
+                ack = await sio.call('message_status_batch', {'ruc': config.RUC, 'events': events}, timeout=10)
+                if not ack or not ack.get('ok'):
+                    logger.warning(f"⚠️ Servidor no confirmo estados: {ack}")
+                    break
+                queue_manager.ack_outbox(events[-1]['seq'])
+                logger.info(f"📤 {len(events)} estados reportados al servidor")
+            except Exception as e:
+                logger.warning(f"⚠️ Error enviando estados (se reintentara): {e}")
+                break
+
+async def report_queue_stats():
+    """Periodically report queue depth and throughput so the server can throttle or reroute."""
+    from app.services.queue_manager import queue_manager
+
+    while True:
+        await asyncio.sleep(config.STATS_INTERVAL)
+        if not sio.connected:
+            continue
+        try:
+            stats = queue_manager.get_stats()
+            stats['ruc'] = config.RUC
+            stats['throughput_per_min'] = round(stats['sent_last_window'] * 60.0 / stats['window'], 2)
+            await sio.emit('queue_stats', stats)
+        except Exception as e:
+            logger.error(f"⚠️ Error reportando queue_stats: {e}")
 
 app = FastAPI(title="Control-WHA (Playwright + Socket.IO)")
 
@@ -148,41 +207,76 @@ def home():
 async def startup_event():
     #  Diagnostico de Red
     target_url = config.SOCKET_URL
-    print(f"Diagnostico: Verificando acceso a {target_url}...")
+    logger.info(f"Diagnostico: Verificando acceso a {target_url}...")
     try:
         import aiohttp
         async with aiohttp.ClientSession() as session:
             async with session.get(target_url, timeout=5) as resp:
-                print(f"Conexion HTTP Exitosa: Status {resp.status}")
-                print(f"   (El servidor responde correctamente)")
+                logger.info(f"Conexion HTTP Exitosa: Status {resp.status}")
+                logger.info("   (El servidor responde correctamente)")
     except Exception as e:
-        print(f"Diagnostico Fallido: {e}")
-        print("   -> Posible bloqueo de Firewall o error DNS en Python.")
+        logger.warning(f"Diagnostico Fallido: {e}")
+        logger.info("   -> Posible bloqueo de Firewall o error DNS en Python.")
 
     # Define Callback for Browser Closure
     async def on_browser_closed():
-        print("🔴 Navegador cerrado! Notificando al servidor...")
+        logger.info("🔴 Navegador cerrado! Notificando al servidor...")
         await sio.emit('client_status', {'ruc': config.RUC, 'status': 'browser_closed'})
 
-    try:
-        await service.start(on_browser_close_callback=on_browser_closed)
-        asyncio.create_task(service.wait_for_login())
-    except Exception as e:
-        print(f"⚠️ Error al iniciar WhatsApp Service (probablemente faltan navegadores): {e}")
+    if config.SUPERVISOR:
+        # Browser lives in child processes: intake keeps running if they crash or hang
+        loop = asyncio.get_running_loop()
+
+        def on_worker_exit(worker_id, exitcode):
+            from app.worker import EXIT_BROWSER_CLOSED
+            status = 'browser_closed' if exitcode == EXIT_BROWSER_CLOSED else 'worker_restarted'
+            asyncio.run_coroutine_threadsafe(
+                sio.emit('client_status', {'ruc': config.RUC, 'status': status, 'worker_id': worker_id}), loop
+            )
+
+        supervisor.start(on_worker_exit=on_worker_exit)
+    else:
+        # Rows left in PROCESSING by a previous run (crash, console closed, forced exit)
+        # can't be trusted: fail them so counters, queue_stats and chat streams see an idle queue
+        from app.services.queue_manager import queue_manager
+        queue_manager.release_stuck(reason="Programa cerrado durante el envio")
+        try:
+            await service.start(on_browser_close_callback=on_browser_closed)
+            asyncio.create_task(service.wait_for_login())
+        except Exception as e:
+            logger.error(f"⚠️ Error al iniciar WhatsApp Service (probablemente faltan navegadores): {e}")
+
+    # Scheduled sends (send_at): timer-heap dispatcher, runs in the intake process
+    scheduler.start()
+
+    # Group commit for socket and HTTP bursts
+    write_buffer.start()
+
+    # Long-polling of HTTP jobs (GET /jobs/{id}?wait=)
+    job_waiter.start()
+
+    # Per-message status reporting (durable outbox)
+    asyncio.create_task(flush_status_outbox())
+
+    # Backpressure: periodic queue depth/throughput report
+    if config.STATS_INTERVAL > 0:
+        asyncio.create_task(report_queue_stats())
 
     # Register Connect Handler
     @sio.event
     async def connect():
-        print(f"✅ Conectado al Socket Server! ID: {sio.sid}")
+        logger.info(f"✅ Conectado al Socket Server! ID: {sio.sid}")
         # Send RUC and TOKEN for authentication
         await sio.emit('register', {'ruc': config.RUC, 'token': config.TOKEN})
+        # Replay status events that could not be delivered while disconnected
+        outbox_wakeup.set()
 
 
     # Listen for duplicate session disconnect
     @sio.on('force_disconnect')
     async def on_force_disconnect(data):
         reason = data.get('reason', 'Sesión duplicada.')
-        print(f"\n⚠️🛑 CIERRE FORZADO: {reason}")
+        logger.warning(f"⚠️🛑 CIERRE FORZADO: {reason}")
         
         # Show Blocking Alert (Windows Native)
         try:
@@ -193,6 +287,9 @@ async def startup_event():
             pass
 
         # Cleanup and Exit
+        if config.SUPERVISOR:
+            # Joins the worker processes: keep it off the event loop
+            await asyncio.get_running_loop().run_in_executor(None, supervisor.stop)
         await service.close()
         # Force Exit
         import os
@@ -200,17 +297,23 @@ async def startup_event():
 
     # Connect to Socket Server
     try:
-        print("Intentando conectar Socket.IO...")
+        logger.info("Intentando conectar Socket.IO...")
         await sio.connect(
             config.SOCKET_URL,
             transports=['websocket', 'polling'], # Force dual transport support
             wait_timeout=20
         )
     except Exception as e:
-        print(f"⚠️ No se pudo conectar al Socket Server: {e}")
+        logger.warning(f"⚠️ No se pudo conectar al Socket Server: {e}")
 
 @app.on_event("shutdown")
 async def shutdown_event():
+    # Persist anything still staged before tearing down
+    write_buffer.stop()
+    scheduler.stop()
+    job_waiter.stop()
+    if config.SUPERVISOR:
+        await asyncio.get_running_loop().run_in_executor(None, supervisor.stop)
     await service.close()
     await sio.disconnect()
 
@@ -0,0 +1,70 @@
+import re
+import time
+
+from app.core import config
+from app.services import minhash
+from app.services.queue_manager import queue_manager
+from app.services.scheduler import parse_send_at
+from app.services.write_behind import write_buffer
+from app.core.log import get_logger
+
+logger = get_logger(__name__)
+
+
+def normalize_phone(phone_number):
+    """
+    Digits-only phone, accepting the usual human formats ("+51 999 999 999", "51-999-999-999").
+    Returns None if anything else is left.
+    """
+    phone = re.sub(r"[\s\-]", "", str(phone_number or '')).lstrip('+')
+    return phone if phone.isdigit() else None
+
+
+async def enqueue_message(phone_number, message, image_path=None, send_at=None):
+    """
+    Single entry point for new messages (Socket.IO and HTTP): validation, invalid-number
+    cache, anti-spam and group-committed enqueue.
+    Returns: { "status": "queued"|"scheduled", "id": ... } or { "status": "rejected", "reason": ..., "detail": ... }
+    reason: invalid, invalid_number, duplicate, error
+    """
+    if not str(phone_number or '').strip() or not message:
+        logger.warning("⚠️ Datos incompletos (Falta phone o message)")
+        return {'status': 'rejected', 'reason': 'invalid', 'detail': 'Falta phone_number o message'}
+
+    phone = normalize_phone(phone_number)
+    if not phone:
+        logger.warning(f"⚠️ Numero invalido: {phone_number}")
+        return {'status': 'rejected', 'reason': 'invalid', 'detail': 'phone_number debe ser numerico'}
+
+    try:
+        send_at = parse_send_at(send_at)
+    except ValueError:
+        logger.warning(f"⚠️ send_at invalido: {send_at}")
+        return {'status': 'rejected', 'reason': 'invalid', 'detail': 'send_at debe ser ISO 8601 o epoch'}
+    is_scheduled = send_at is not None and send_at > time.time()
+
+    if queue_manager.is_invalid_number(phone):
+        logger.info(f"🚫 Numero sin WhatsApp (cache): {phone}")
+        return {'status': 'rejected', 'reason': 'invalid_number', 'detail': 'Numero no registrado en WhatsApp'}
+
+    # Signed once here: the anti-spam checks and the stored row all reuse it
+    signature = minhash.signature(message)
+
+    # Anti-Spam at intake: reject before it ever reaches the queue
+    # (scheduled reminders are checked when they become due, not now)
+    if config.SIMILARITY_THRESHOLD > 0 and not is_scheduled:
+        threshold = config.SIMILARITY_THRESHOLD / 100.0
+        is_dup, reason = queue_manager.check_duplicate(phone, message, exclude_id=0, threshold=threshold, include_pending=True, signature=signature)
+        if not is_dup:
+            is_dup, reason = write_buffer.check_duplicate(phone, message, threshold, signature=signature)
+        if is_dup:
+            return {'status': 'rejected', 'reason': 'duplicate', 'detail': reason}
+
+    logger.info(f"📥 Encolando mensaje para {phone}...")
+    try:
+        # Group commit: the answer goes out once the batch holding this message is written
+        msg_id = await write_buffer.submit(phone, message, image_path, send_at=send_at, signature=signature)
+    except Exception as e:
+        logger.error(f"❌ Error encolando mensaje: {e}")
+        return {'status': 'rejected', 'reason': 'error', 'detail': str(e)}
+    return {'status': 'scheduled' if is_scheduled else 'queued', 'id': msg_id}
@@ -0,0 +1,93 @@
+import asyncio
+
+from app.services.queue_manager import queue_manager
+from app.core.log import get_logger
+
+logger = get_logger(__name__)
+
+# Queue states after which a job no longer changes
+FINAL_STATUSES = ('SENT', 'ERROR', 'DUPLICATE')
+
+# How often waiting jobs are re-checked in one query, for completions made by
+# another process (supervisor workers) that can't call us back
+CHECK_INTERVAL = 1.0
+
+
+class JobWaiter:
+    """
+    Long-poll support for HTTP jobs (queue rows).
+    Waiters are plain futures: completions in this process resolve them right away
+    through queue_manager.on_completed; the rest are found by a single batched status
+    query while (and only while) someone is waiting.
+    """
+
+    def __init__(self):
+        self.waiters = {} # job_id -> [future]
+        self.loop = None
+        self.task = None
+        self.wakeup = None
+
+    def start(self):
+        if self.task:
+            return
+        self.loop = asyncio.get_running_loop()
+        self.wakeup = asyncio.Event()
+        queue_manager.on_completed = self.notify
+        self.task = asyncio.create_task(self.run())
+
+    def notify(self, job_ids):
+        """Mark jobs as finished. Safe to call from any thread (supervisor monitor, threadpool)."""
+        if self.loop is None:
+            return
+        try:
+            self.loop.call_soon_threadsafe(self._resolve, job_ids)
+        except RuntimeError:
+            pass # Loop already closed (shutdown)
+
+    def _resolve(self, job_ids):
+        for job_id in job_ids:
+            for future in self.waiters.pop(job_id, []):
+                if not future.done():
+                    future.set_result(True)
+
+    async def wait(self, job_id, timeout):
+        """Wait until `job_id` reaches a final state or `timeout` seconds pass. Returns True if finished."""
+        future = self.loop.create_future()
+        self.waiters.setdefault(job_id, []).append(future)
+        self.wakeup.set()
+        try:
+            return await asyncio.wait_for(future, timeout=timeout)
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            pending = self.waiters.get(job_id)
+            if pending and future in pending:
+                pending.remove(future)
+                if not pending:
+                    del self.waiters[job_id]
+
+    async def run(self):
+        while True:
+            try:
+                if not self.waiters:
+                    self.wakeup.clear()
+                    await self.wakeup.wait()
+                await asyncio.sleep(CHECK_INTERVAL)
+
+                statuses = queue_manager.get_statuses(list(self.waiters))
+                done = [job_id for job_id, status in statuses.items() if status in FINAL_STATUSES]
+                self._resolve(done)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"⚠️ Job Waiter Error: {e}")
+                await asyncio.sleep(5)
+
+    def stop(self):
+        if self.task:
+            self.task.cancel()
+            self.task = None
+        queue_manager.on_completed = None
+
+
+job_waiter = JobWaiter()
@@ -0,0 +1,62 @@
+import hashlib
+import re
+import struct
+
+# MinHash over character shingles.
+# The fraction of equal slots between two signatures estimates the Jaccard
+# similarity of their shingle sets (share of 4-character fragments in common),
+# which is what SIMILARITY_THRESHOLD expresses: 90 = 90% of fragments shared.
+# With 64 slots the estimate has a standard error of about 4 points near 90%.
+
+NUM_PERM = 64
+SHINGLE_SIZE = 4
+_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+_FORMAT = f">{NUM_PERM}I"
+
+
+def _permutations():
+    # Fixed seeds so signatures stay comparable across processes and restarts
+    perms = []
+    for i in range(NUM_PERM):
+        digest = hashlib.blake2b(f"minhash-{i}".encode("utf-8"), digest_size=16).digest()
+        a = int.from_bytes(digest[:8], "big") % (_PRIME - 1) + 1
+        b = int.from_bytes(digest[8:], "big") % _PRIME
+        perms.append((a, b))
+    return perms
+
+
+_PERMS = _permutations()
+
+
+def normalize(text):
+    """Lowercase and collapse whitespace so formatting noise doesn't change the signature."""
+    return re.sub(r"\s+", " ", (text or "").strip().lower())
+
+
+def _shingles(text):
+    if len(text) <= SHINGLE_SIZE:
+        return {text}
+    return {text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+
+
+def _hash64(token):
+    # hashlib (not hash()) so signatures stay stable across processes and restarts
+    return int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def signature(text):
+    """MinHash signature of `text` as bytes (NUM_PERM 32-bit slots, stored as a SQLite BLOB)."""
+    hashes = [_hash64(s) for s in _shingles(normalize(text))]
+    slots = [
+        min(((a * h + b) % _PRIME) & _MAX_HASH for h in hashes)
+        for a, b in _PERMS
+    ]
+    return struct.pack(_FORMAT, *slots)
+
+
+def similarity(sig_a, sig_b):
+    """Estimated Jaccard similarity in [0, 1] between two signatures."""
+    slots_a = struct.unpack(_FORMAT, sig_a)
+    slots_b = struct.unpack(_FORMAT, sig_b)
+    return sum(1 for x, y in zip(slots_a, slots_b) if x == y) / NUM_PERM
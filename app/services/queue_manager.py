@@ -3,11 +3,19 @@ import os
 import time
 from pathlib import Path
 from app.core import config
+from app.services import minhash
+from app.core.log import get_logger
+
+logger = get_logger(__name__)
 
 DB_PATH = config.EXEC_DIR / "messages.sqlite"
 
 class QueueManager:
     def __init__(self):
+        # Called with (msg_id, send_at) when a message is stored as SCHEDULED (set by the scheduler)
+        self.on_scheduled = None
+        # Called with a list of ids after they reach a final state (set by the job waiter)
+        self.on_completed = None
         self.init_db()
 
     def init_db(self):
@@ -26,7 +34,7 @@ class QueueManager:
         for path_candidate in paths_to_try:
             try:
                 msg_path = str(path_candidate)
-                print(f"📁 Attempting Database Path: {msg_path}")
+                logger.debug(f"📁 Attempting Database Path: {msg_path}")
                 
                 # Ensure directory exists
                 directory = os.path.dirname(msg_path)
@@ -42,112 +50,487 @@ class QueueManager:
                         phone TEXT NOT NULL,
                         message TEXT NOT NULL,
                         image_path TEXT,
-                        status TEXT DEFAULT 'PENDING', -- PENDING, PROCESSING, SENT, ERROR
+                        status TEXT DEFAULT 'PENDING', -- SCHEDULED, PENDING, PROCESSING, SENT, ERROR, DUPLICATE
                         created_at REAL,
                         processed_at REAL,
-                        error_msg TEXT
+                        error_msg TEXT,
+                        delivery_state TEXT, -- sent, delivered, read, pending (measured in WhatsApp Web)
+                        signature BLOB, -- MinHash of the message, for near-duplicate detection
+                        worker_id INTEGER, -- Sender worker that claimed the row (supervisor mode)
+                        send_at REAL -- Scheduled send time (epoch); NULL = as soon as possible
+                    )
+                ''')
+                self._migrate(c)
+                c.execute('''
+                    CREATE TABLE IF NOT EXISTS status_outbox (
+                        seq INTEGER PRIMARY KEY AUTOINCREMENT, -- Replay order
+                        msg_id INTEGER NOT NULL,
+                        phone TEXT,
+                        status TEXT, -- SENT, ERROR, DUPLICATE
+                        error_msg TEXT,
+                        delivery_state TEXT,
+                        created_at REAL,
+                        send_at REAL,
+                        processed_at REAL
+                    )
+                ''')
+                c.execute('''
+                    CREATE TABLE IF NOT EXISTS invalid_numbers (
+                        phone TEXT PRIMARY KEY, -- Not on WhatsApp (negative cache)
+                        detected_at REAL,
+                        reason TEXT
                     )
                 ''')
+                c.execute("CREATE INDEX IF NOT EXISTS idx_queue_status_send_at ON message_queue (status, send_at)")
+                # Indexes for the consumer (status scan) and the anti-spam lookup (phone window)
+                c.execute("CREATE INDEX IF NOT EXISTS idx_queue_status_created ON message_queue (status, created_at)")
+                c.execute("CREATE INDEX IF NOT EXISTS idx_queue_phone_created ON message_queue (phone, created_at)")
+                # Indexes for the inspection API (keyset pagination) and throughput stats
+                c.execute("CREATE INDEX IF NOT EXISTS idx_queue_created ON message_queue (created_at)")
+                c.execute("CREATE INDEX IF NOT EXISTS idx_queue_status_processed ON message_queue (status, processed_at)")
+                self._init_counters(c)
                 conn.commit()
                 conn.close()
                 
                 # If success, update the global DB_PATH with the working one
                 DB_PATH = path_candidate
-                print(f"✅ Database initialized successfully at: {DB_PATH}")
+                logger.info(f"✅ Database initialized successfully at: {DB_PATH}")
                 return # Exit success
 
             except Exception as e:
-                print(f"⚠️ Failed to init DB at {path_candidate}: {e}")
+                logger.warning(f"⚠️ Failed to init DB at {path_candidate}: {e}")
                 continue # Try next path
 
         # If all fail
         raise Exception("CRITICAL: Could not write database to ANY location (Exe, AppData, Temp). Check Permissions.")
 
-    def add_message(self, phone, message, image_path=None):
+    def _migrate(self, c):
+        """Add columns introduced after the first release to existing databases."""
+        existing = {row[1] for row in c.execute("PRAGMA table_info(message_queue)")}
+        new_columns = {
+            'delivery_state': 'TEXT',
+            'signature': 'BLOB',
+            'worker_id': 'INTEGER',
+            'send_at': 'REAL',
+        }
+        for name, decl in new_columns.items():
+            if name not in existing:
+                c.execute(f"ALTER TABLE message_queue ADD COLUMN {name} {decl}")
+
+    def _init_counters(self, c):
+        """
+        Per-status row counts kept up to date by triggers on every insert, status
+        change and delete, so reading them is O(1) whatever the table size.
+        """
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS queue_counters (
+                status TEXT PRIMARY KEY,
+                count INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        c.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_queue_count_insert AFTER INSERT ON message_queue
+            BEGIN
+                INSERT OR IGNORE INTO queue_counters (status, count) VALUES (NEW.status, 0);
+                UPDATE queue_counters SET count = count + 1 WHERE status = NEW.status;
+            END
+        ''')
+        c.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_queue_count_update AFTER UPDATE OF status ON message_queue
+            WHEN OLD.status IS NOT NEW.status
+            BEGIN
+                UPDATE queue_counters SET count = count - 1 WHERE status = OLD.status;
+                INSERT OR IGNORE INTO queue_counters (status, count) VALUES (NEW.status, 0);
+                UPDATE queue_counters SET count = count + 1 WHERE status = NEW.status;
+            END
+        ''')
+        c.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_queue_count_delete AFTER DELETE ON message_queue
+            BEGIN
+                UPDATE queue_counters SET count = count - 1 WHERE status = OLD.status;
+            END
+        ''')
+        # First run on an existing database: seed the counters once
+        c.execute("SELECT COUNT(*) FROM queue_counters")
+        if c.fetchone()[0] == 0:
+            c.execute("INSERT INTO queue_counters (status, count) SELECT status, COUNT(*) FROM message_queue GROUP BY status")
+
+    def add_message(self, phone, message, image_path=None, send_at=None, signature=None):
+        """
+        send_at: epoch seconds; a future time stores the row as SCHEDULED instead of PENDING.
+        signature: minhash.signature(message) if the caller already has it.
+        """
+        return self.add_messages([(phone, message, image_path, send_at, signature)])[0]
+
+    def add_messages(self, items):
+        """
+        Insert several messages in a single transaction (one commit/fsync for the group).
+        items: list of (phone, message, image_path, send_at, signature); signature may be None.
+        Returns: list of new ids, in the same order.
+        """
+        # Intake already signed its messages; anything else is signed before the transaction opens
+        signatures = [sig if sig is not None else minhash.signature(message) for _, message, _, _, sig in items]
+        now = time.time()
         conn = sqlite3.connect(str(DB_PATH))
         c = conn.cursor()
-        c.execute('''
-            INSERT INTO message_queue (phone, message, image_path, status, created_at)
-            VALUES (?, ?, ?, 'PENDING', ?)
-        ''', (phone, message, image_path, time.time()))
+        inserted = []
+        for (phone, message, image_path, send_at, _), signature in zip(items, signatures):
+            status = 'SCHEDULED' if send_at and send_at > now else 'PENDING'
+            c.execute('''
+                INSERT INTO message_queue (phone, message, image_path, status, created_at, signature, send_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (phone, message, image_path, status, now, signature, send_at))
+            inserted.append((c.lastrowid, phone, status, send_at))
         conn.commit()
         conn.close()
-        print(f"📥 Cola: Mensaje guardado para {phone}")
+
+        for msg_id, phone, status, send_at in inserted:
+            logger.debug(f"📥 Cola: Mensaje {msg_id} guardado para {phone} ({status})")
+            if status == 'SCHEDULED' and self.on_scheduled:
+                self.on_scheduled(msg_id, send_at)
+        return [msg_id for msg_id, _, _, _ in inserted]
+
+    def get_scheduled(self, limit):
+        """Earliest SCHEDULED rows as (send_at, id), using the (status, send_at) index."""
+        conn = sqlite3.connect(str(DB_PATH))
+        c = conn.cursor()
+        c.execute("SELECT send_at, id FROM message_queue WHERE status='SCHEDULED' ORDER BY send_at ASC LIMIT ?", (limit,))
+        rows = c.fetchall()
+        conn.close()
+        return rows
+
+    def release_scheduled(self, msg_ids):
+        """Move due SCHEDULED rows to PENDING so the consumer picks them up. Returns rows moved."""
+        if not msg_ids:
+            return 0
+        conn = sqlite3.connect(str(DB_PATH))
+        c = conn.cursor()
+        c.executemany("UPDATE message_queue SET status='PENDING' WHERE id=? AND status='SCHEDULED'", [(i,) for i in msg_ids])
+        moved = c.rowcount
+        conn.commit()
+        conn.close()
+        return moved
 
     def get_next_pending(self):
+        batch = self.get_next_batch()
+        return batch[0] if batch else None
+
+    def get_next_batch(self, prefer_phone=None, coalesce_window=0, worker_id=None):
+        """
+        Fetch the next group of pending messages to send in a single chat session.
+        prefer_phone: keep draining this phone first (its chat is already open).
+        coalesce_window: seconds; text-only messages to the same phone queued within this
+        window of the first one are returned together so they can be merged. 0 = one row.
+        worker_id: sender worker claiming the rows (supervisor mode).
+        Returns: list of rows (dicts), all marked PROCESSING. Empty list if nothing pending.
+        """
         conn = sqlite3.connect(str(DB_PATH))
         conn.row_factory = sqlite3.Row
         c = conn.cursor()
-        # Fetch one pending message, prioritizing oldest
-        c.execute("SELECT * FROM message_queue WHERE status='PENDING' ORDER BY created_at ASC LIMIT 1")
-        row = c.fetchone()
-        
-        data = None
+        # Take the write lock up front: several worker processes may claim at once
+        c.execute("BEGIN IMMEDIATE")
+
+        row = None
+        if prefer_phone:
+            c.execute("SELECT * FROM message_queue WHERE status='PENDING' AND phone=? ORDER BY created_at ASC LIMIT 1", (prefer_phone,))
+            row = c.fetchone()
+        if not row:
+            # Fetch one pending message, prioritizing oldest
+            c.execute("SELECT * FROM message_queue WHERE status='PENDING' ORDER BY created_at ASC LIMIT 1")
+            row = c.fetchone()
+
+        batch = []
         if row:
-            data = dict(row)
-            # Mark as processing immediately to avoid race conditions if multiple workers existed (though we have 1)
-            c.execute("UPDATE message_queue SET status='PROCESSING' WHERE id=?", (data['id'],))
-            conn.commit()
-            
+            batch.append(dict(row))
+            if coalesce_window > 0 and not row['image_path']:
+                # Stop at the next pending image for this phone: texts queued after it
+                # must not overtake it
+                c.execute('''
+                    SELECT * FROM message_queue
+                    WHERE status='PENDING' AND phone=? AND id != ?
+                    AND (image_path IS NULL OR image_path = '')
+                    AND created_at <= ?
+                    AND id < IFNULL((
+                        SELECT MIN(id) FROM message_queue
+                        WHERE status='PENDING' AND phone=? AND id > ?
+                        AND image_path IS NOT NULL AND image_path != ''
+                    ), 9223372036854775807)
+                    ORDER BY created_at ASC
+                ''', (row['phone'], row['id'], row['created_at'] + coalesce_window, row['phone'], row['id']))
+                batch.extend(dict(r) for r in c.fetchall())
+
+            # Mark as processing immediately to avoid race conditions between workers
+            c.executemany("UPDATE message_queue SET status='PROCESSING', worker_id=? WHERE id=?", [(worker_id, m['id']) for m in batch])
+
+        conn.commit()
+        conn.close()
+        return batch
+
+    def release_stuck(self, worker_id=None, reason="Worker reiniciado durante el envio"):
+        """
+        Fail rows left in PROCESSING by a worker that died or hung.
+        They are not retried: the message may already have left the browser.
+        worker_id: only that worker's rows (None = all PROCESSING rows).
+        Returns: number of rows failed.
+        """
+        conn = sqlite3.connect(str(DB_PATH))
+        c = conn.cursor()
+        if worker_id is None:
+            c.execute("SELECT id FROM message_queue WHERE status='PROCESSING'")
+        else:
+            c.execute("SELECT id FROM message_queue WHERE status='PROCESSING' AND worker_id=?", (worker_id,))
+        msg_ids = [row[0] for row in c.fetchall()]
+        self._fail_rows(c, msg_ids, reason)
+        released = len(msg_ids)
+        conn.commit()
         conn.close()
-        return data
+        self._notify_completed(msg_ids)
+        if released:
+            logger.warning(f"⚠️ Cola: {released} mensajes en PROCESSING marcados como ERROR ({reason})")
+        return released
+
+    def _record_status(self, c, msg_ids):
+        """Copy the final state of `msg_ids` into status_outbox (same transaction as the update)."""
+        c.executemany('''
+            INSERT INTO status_outbox (msg_id, phone, status, error_msg, delivery_state, created_at, send_at, processed_at)
+            SELECT id, phone, status, error_msg, delivery_state, created_at, send_at, processed_at
+            FROM message_queue WHERE id=?
+        ''', [(i,) for i in msg_ids])
 
-    def mark_completed(self, msg_id, status='SENT', error=None):
+    def _notify_completed(self, msg_ids):
+        if msg_ids and self.on_completed:
+            try:
+                self.on_completed(list(msg_ids))
+            except Exception as e:
+                logger.error(f"Error en on_completed: {e}")
+
+    def _fail_rows(self, c, msg_ids, reason):
+        c.executemany("UPDATE message_queue SET status='ERROR', processed_at=?, error_msg=? WHERE id=?",
+                      [(time.time(), reason, i) for i in msg_ids])
+        self._record_status(c, msg_ids)
+
+    def mark_completed(self, msg_id, status='SENT', error=None, delivery_state=None):
         conn = sqlite3.connect(str(DB_PATH))
         c = conn.cursor()
         c.execute('''
             UPDATE message_queue 
-            SET status=?, processed_at=?, error_msg=?
+            SET status=?, processed_at=?, error_msg=?, delivery_state=?
             WHERE id=?
-        ''', (status, time.time(), error, msg_id))
+        ''', (status, time.time(), error, delivery_state, msg_id))
+        self._record_status(c, [msg_id])
         conn.commit()
+        conn.close()
+        self._notify_completed([msg_id])
+
+    def mark_invalid_number(self, phone, reason="Numero no registrado en WhatsApp"):
+        """
+        Remember that `phone` is not on WhatsApp (for config.INVALID_NUMBER_TTL seconds)
+        and fail its pending messages right away, without touching the browser.
+        Returns: number of pending messages failed.
+        """
+        conn = sqlite3.connect(str(DB_PATH))
+        c = conn.cursor()
+        c.execute('''
+            INSERT OR REPLACE INTO invalid_numbers (phone, detected_at, reason)
+            VALUES (?, ?, ?)
+        ''', (phone, time.time(), reason))
+        c.execute("SELECT id FROM message_queue WHERE phone=? AND status='PENDING'", (phone,))
+        msg_ids = [row[0] for row in c.fetchall()]
+        self._fail_rows(c, msg_ids, reason)
+        conn.commit()
+        conn.close()
+        self._notify_completed(msg_ids)
+        logger.info(f"🚫 Numero invalido en cache: {phone} ({len(msg_ids)} pendientes descartados)")
+        return len(msg_ids)
+
+    def is_invalid_number(self, phone):
+        """True if `phone` was detected as not on WhatsApp within the TTL."""
+        if config.INVALID_NUMBER_TTL <= 0:
+            return False
+        conn = sqlite3.connect(str(DB_PATH))
+        c = conn.cursor()
+        c.execute("SELECT 1 FROM invalid_numbers WHERE phone=? AND detected_at > ?",
+                  (phone, time.time() - config.INVALID_NUMBER_TTL))
+        row = c.fetchone()
+        conn.close()
+        return row is not None
+
+    def get_outbox(self, limit=100):
+        """Oldest undelivered status events, in the order they happened."""
+        conn = sqlite3.connect(str(DB_PATH))
+        conn.row_factory = sqlite3.Row
+        c = conn.cursor()
+        c.execute("SELECT * FROM status_outbox ORDER BY seq ASC LIMIT ?", (limit,))
+        rows = [dict(r) for r in c.fetchall()]
+        conn.close()
+        return rows
+
+    def ack_outbox(self, last_seq):
+        """Drop events up to `last_seq` once the server confirmed them."""
+        conn = sqlite3.connect(str(DB_PATH))
+        c = conn.cursor()
+        c.execute("DELETE FROM status_outbox WHERE seq <= ?", (last_seq,))
         conn.commit()
         conn.close()
 
-    def check_duplicate(self, phone, current_message, exclude_id, threshold=0.9):
+    def get_counters(self):
+        """Rows per status (O(1), maintained by triggers)."""
+        conn = sqlite3.connect(str(DB_PATH))
+        c = conn.cursor()
+        c.execute("SELECT status, count FROM queue_counters")
+        counts = dict(c.fetchall())
+        conn.close()
+        return counts
+
+    def get_statuses(self, msg_ids):
+        """Current status of several rows in one query: {id: status}."""
+        if not msg_ids:
+            return {}
+        conn = sqlite3.connect(str(DB_PATH))
+        c = conn.cursor()
+        placeholders = ','.join('?' * len(msg_ids))
+        c.execute(f"SELECT id, status FROM message_queue WHERE id IN ({placeholders})", list(msg_ids))
+        statuses = dict(c.fetchall())
+        conn.close()
+        return statuses
+
+    def get_message(self, msg_id):
+        conn = sqlite3.connect(str(DB_PATH))
+        conn.row_factory = sqlite3.Row
+        c = conn.cursor()
+        c.execute("SELECT * FROM message_queue WHERE id=?", (msg_id,))
+        row = c.fetchone()
+        conn.close()
+        return dict(row) if row else None
+
+    def list_messages(self, status=None, phone=None, since=None, until=None, cursor=None, limit=50):
+        """
+        Newest-first listing with keyset pagination on (created_at, id).
+        cursor: (created_at, id) of the last row of the previous page.
+        Every filter combination is served by an index ordered by created_at
+        (status / phone / created_at), so a page costs `limit` rows, not an OFFSET scan.
+        Returns: (rows, next_cursor or None)
+        """
+        where = []
+        params = []
+        if status:
+            where.append("status = ?")
+            params.append(status)
+        if phone:
+            where.append("phone = ?")
+            params.append(phone)
+        if since is not None:
+            where.append("created_at >= ?")
+            params.append(since)
+        if until is not None:
+            where.append("created_at < ?")
+            params.append(until)
+        if cursor:
+            where.append("(created_at, id) < (?, ?)")
+            params.extend(cursor)
+
+        sql = "SELECT * FROM message_queue"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY created_at DESC, id DESC LIMIT ?"
+        params.append(limit + 1)
+
+        conn = sqlite3.connect(str(DB_PATH))
+        conn.row_factory = sqlite3.Row
+        c = conn.cursor()
+        c.execute(sql, params)
+        rows = [dict(r) for r in c.fetchall()]
+        conn.close()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = (rows[-1]['created_at'], rows[-1]['id'])
+        return rows, next_cursor
+
+    def get_stats(self, window=60):
+        """
+        Queue depth and throughput snapshot, reported upstream for backpressure.
+        Returns: dict with pending, processing and messages sent in the last `window` seconds.
+        """
+        counts = self.get_counters()
+        conn = sqlite3.connect(str(DB_PATH))
+        c = conn.cursor()
+        c.execute("SELECT COUNT(*) FROM message_queue WHERE status='SENT' AND processed_at > ?", (time.time() - window,))
+        sent_recent = c.fetchone()[0]
+        conn.close()
+        return {
+            'pending': counts.get('PENDING', 0),
+            'processing': counts.get('PROCESSING', 0),
+            'scheduled': counts.get('SCHEDULED', 0),
+            'sent_last_window': sent_recent,
+            'window': window,
+        }
+
+    def check_duplicate(self, phone, current_message, exclude_id, threshold=0.9, include_pending=False, signature=None):
         """
         Check if a similar message was sent to this phone recently.
+        exclude_id: id (or list of ids) of the message(s) being checked.
+        threshold: 0-1 share of 4-character shingles in common (MinHash Jaccard estimate); 1.0 means exact text only.
+        include_pending: also match rows still waiting in the queue (used at enqueue time).
+        signature: minhash.signature(current_message) if already known (computed on demand otherwise).
         Returns: (bool, reason)
         """
         try:
-            import time
-            
             conn = sqlite3.connect(str(DB_PATH))
             conn.row_factory = sqlite3.Row
             c = conn.cursor()
             
-            # SIMPLIFIED RULE: Exact match + Same Phone + Less than 1 Minute ago
+            # RULE: Similar message + Same Phone + Less than 1 Minute ago
             # CRITICAL: Exclude the current message ID (because it's already in DB as PROCESSING)
             cutoff_time = time.time() - 60 
+            statuses = ('SENT', 'PROCESSING', 'PENDING') if include_pending else ('SENT', 'PROCESSING')
+            placeholders = ','.join('?' * len(statuses))
+            exclude_ids = list(exclude_id) if isinstance(exclude_id, (list, tuple, set)) else [exclude_id]
+            exclude_placeholders = ','.join('?' * len(exclude_ids))
             
-            c.execute('''
-                SELECT message, created_at FROM message_queue 
+            c.execute(f'''
+                SELECT message, signature, created_at FROM message_queue 
                 WHERE phone=? 
-                AND id != ? 
-                AND status IN ('SENT', 'PROCESSING')
+                AND id NOT IN ({exclude_placeholders}) 
+                AND status IN ({placeholders})
                 AND created_at > ?
                 ORDER BY created_at DESC 
-                LIMIT 5
-            ''', (phone, exclude_id, cutoff_time))
+                LIMIT 100
+            ''', (phone, *exclude_ids, *statuses, cutoff_time))
             
             rows = c.fetchall()
             conn.close()
 
-            # We don't use threshold anymore, just EXACT string equality
+            current_text = minhash.normalize(current_message)
+            current_sig = signature
+
             for row in rows:
-                prev_msg = row['message']
                 time_ago = int(time.time() - row['created_at'])
                 
                 # EXACT MATCH CHECK
-                if current_message.strip() == prev_msg.strip():
-                    print(f" 🛑 DUPLICADO EXACTO detectado (Hace {time_ago}s)")
+                if current_text == minhash.normalize(row['message']):
+                    logger.info(f"🛑 DUPLICADO EXACTO detectado (Hace {time_ago}s)")
                     return True, f"Duplicado exacto hace {time_ago}s"
 
-                print(f"   ✅ Mensaje diferente (Hace {time_ago}s)")
+                if threshold >= 1.0:
+                    continue
+
+                # NEAR-DUPLICATE CHECK (stored signature, constant time per row)
+                # Rows stored before signatures existed get theirs computed on the fly
+                if current_sig is None:
+                    current_sig = minhash.signature(current_message)
+                prev_sig = row['signature'] if row['signature'] is not None else minhash.signature(row['message'])
+                score = minhash.similarity(current_sig, prev_sig)
+                if score >= threshold:
+                    logger.info(f"🛑 DUPLICADO SIMILAR detectado ({score:.0%}, hace {time_ago}s)")
+                    return True, f"Duplicado similar ({score:.0%}) hace {time_ago}s"
+
+                logger.debug(f"Mensaje diferente ({score:.0%}, hace {time_ago}s)")
             
             return False, None
         except Exception as e:
-            print(f"Error checking duplicate: {e}")
+            logger.error(f"Error checking duplicate: {e}")
             return False, None
 
 queue_manager = QueueManager()
@@ -0,0 +1,118 @@
+import asyncio
+import heapq
+import time
+from datetime import datetime
+
+from app.services.queue_manager import queue_manager
+from app.core.log import get_logger
+
+logger = get_logger(__name__)
+
+# Max scheduled rows kept in memory; later ones are loaded when these run out
+HEAP_LIMIT = 5000
+# Upper bound for a single sleep (guards against wall clock jumps)
+MAX_SLEEP = 600
+
+
+def parse_send_at(value):
+    """
+    Normalize a send_at value to epoch seconds.
+    Accepts datetime, epoch seconds (or milliseconds) and ISO 8601 strings (naive = local time).
+    Returns None if empty. Raises ValueError if invalid.
+    """
+    if value in (None, ""):
+        return None
+    if isinstance(value, datetime):
+        return value.timestamp()
+    if isinstance(value, (int, float)):
+        value = float(value)
+        return value / 1000.0 if value > 1e12 else value
+    value = str(value).strip()
+    try:
+        return parse_send_at(float(value))
+    except ValueError:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+
+
+class Scheduler:
+    """
+    Timer-heap dispatcher for scheduled messages.
+    Keeps the upcoming (send_at, id) pairs in a min-heap and sleeps exactly until the
+    next one is due, then moves it to PENDING. The table is only read at startup and
+    when the in-memory window runs out, never polled.
+    """
+
+    def __init__(self):
+        self.heap = []
+        # send_at of the last row loaded when the query was truncated (None = everything loaded)
+        self.loaded_until = None
+        self.wakeup = None
+        self.task = None
+
+    def start(self):
+        if self.task:
+            return
+        self.wakeup = asyncio.Event()
+        queue_manager.on_scheduled = self.push
+        self._load()
+        self.task = asyncio.create_task(self.run())
+        logger.info(f"⏰ Scheduler iniciado ({len(self.heap)} mensajes programados en memoria)")
+
+    def _load(self):
+        rows = queue_manager.get_scheduled(HEAP_LIMIT)
+        self.heap = [(send_at, msg_id) for send_at, msg_id in rows]
+        heapq.heapify(self.heap)
+        self.loaded_until = rows[-1][0] if len(rows) >= HEAP_LIMIT else None
+
+    def push(self, msg_id, send_at):
+        """Register a newly scheduled message (called by queue_manager.add_message)."""
+        if self.wakeup is None:
+            return
+        if self.loaded_until is not None and send_at > self.loaded_until:
+            # Beyond the in-memory window: it will be loaded with the next batch
+            return
+        is_new_head = not self.heap or send_at < self.heap[0][0]
+        heapq.heappush(self.heap, (send_at, msg_id))
+        if is_new_head:
+            self.wakeup.set()
+
+    def _release_due(self):
+        now = time.time()
+        due = []
+        while self.heap and self.heap[0][0] <= now:
+            due.append(heapq.heappop(self.heap)[1])
+        if due:
+            moved = queue_manager.release_scheduled(due)
+            logger.info(f"⏰ {moved} mensaje(s) programados pasan a la cola")
+
+    async def run(self):
+        while True:
+            try:
+                self.wakeup.clear()
+                self._release_due()
+
+                if not self.heap and self.loaded_until is not None:
+                    self._load()
+                    continue
+
+                timeout = MAX_SLEEP
+                if self.heap:
+                    timeout = min(MAX_SLEEP, max(0.0, self.heap[0][0] - time.time()))
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"⚠️ Scheduler Error: {e}")
+                await asyncio.sleep(5)
+
+    def stop(self):
+        if self.task:
+            self.task.cancel()
+            self.task = None
+        queue_manager.on_scheduled = None
+
+
+scheduler = Scheduler()
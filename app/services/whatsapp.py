@@ -1,12 +1,121 @@
 import asyncio
 import base64
 import os
-from playwright.async_api import async_playwright, Page, BrowserContext
+import re
+from urllib.parse import quote
+from playwright.async_api import async_playwright, Page, BrowserContext, TimeoutError as PlaywrightTimeoutError
 from app.core import config
 from app.services.queue_manager import queue_manager
+from app.core.log import get_logger
+
+logger = get_logger(__name__)
+
+# Max consecutive sends to the open chat before going back to the oldest pending message
+MAX_CHAT_STREAK = 10
+
+# Status icon of the outgoing bubble -> delivery state recorded on the queue row
+DELIVERY_ICONS = {
+    "msg-check": "sent",
+    "msg-dblcheck": "delivered",
+    "msg-dblcheck-ack": "read",
+}
+
+# Runs inside the page: id of the last outgoing bubble and its status icon
+LAST_OUTGOING_JS = """
+() => {
+    const out = document.querySelectorAll('#main div.message-out');
+    if (out.length === 0) return null;
+    const last = out[out.length - 1];
+    const row = last.closest('[data-id]');
+    const icon = last.querySelector('span[data-icon^="msg-"]');
+    return {
+        id: row ? row.getAttribute('data-id') : String(out.length),
+        icon: icon ? icon.getAttribute('data-icon') : null
+    };
+}
+"""
+
+# Runs inside the page: truthy (the tick icon) once a new outgoing bubble left the clock state
+SEND_CONFIRMED_JS = f"""
+(previousId) => {{
+    const snap = ({LAST_OUTGOING_JS})();
+    if (!snap || snap.id === previousId) return null;
+    if (!snap.icon || snap.icon === 'msg-time') return null;
+    return snap.icon;
+}}
+"""
+
+# Runs inside the page: tag the open chat (or check the tag) so consecutive
+# messages to the same phone can skip the /send?phone= navigation
+TAG_CHAT_JS = """
+(phone) => {
+    const main = document.querySelector('#main');
+    if (!main) return null;
+    const title = main.querySelector('header span[title]');
+    main.dataset.cwhaPhone = phone;
+    main.dataset.cwhaTitle = title ? title.getAttribute('title') : '';
+    return true;
+}
+"""
+
+CHAT_IS_OPEN_JS = """
+(phone) => {
+    const main = document.querySelector('#main');
+    if (!main || main.dataset.cwhaPhone !== phone) return false;
+    const title = main.querySelector('header span[title]');
+    return (title ? title.getAttribute('title') : '') === main.dataset.cwhaTitle;
+}
+"""
+
+# Runs inside the page: messages of the open chat after a cursor, in one round trip
+READ_MESSAGES_JS = """
+([after, limit]) => {
+    const seen = new Set();
+    const rows = [];
+    for (const row of document.querySelectorAll('#main [data-id]')) {
+        const id = row.getAttribute('data-id');
+        if (seen.has(id) || !row.querySelector('.message-in, .message-out')) continue;
+        seen.add(id);
+        rows.push(row);
+    }
+
+    let start = Math.max(0, rows.length - limit);
+    let cursorFound = after === null;
+    if (after !== null) {
+        const idx = rows.findIndex(r => r.getAttribute('data-id') === after);
+        cursorFound = idx >= 0;
+        // Cursor scrolled out of the loaded history: return everything loaded
+        start = cursorFound ? idx + 1 : 0;
+    }
+
+    const messages = rows.slice(start, start + limit).map(row => {
+        const copyable = row.querySelector('[data-pre-plain-text]');
+        const text = row.querySelector('span.selectable-text');
+        return {
+            id: row.getAttribute('data-id'),
+            from_me: !!row.querySelector('.message-out'),
+            meta: copyable ? copyable.getAttribute('data-pre-plain-text').trim() : null,
+            content: text ? text.innerText : ''
+        };
+    });
+    return { messages, has_more: start + limit < rows.length, cursor_found: cursorFound };
+}
+"""
+
+# "Phone number shared via url is invalid" dialog (English / Spanish UI)
+INVALID_NUMBER_TEXT = re.compile(r"(url is invalid|no es v[aá]lido)", re.IGNORECASE)
+
+
+class InvalidNumberError(Exception):
+    """The phone number is not registered on WhatsApp."""
+
 
 class WhatsAppService:
     _instance = None
+    last_send_error = None
+    current_chat_phone = None
+    worker_id = None
+    on_heartbeat = None
     playwright = None
     browser = None
     context = None
@@ -15,6 +124,8 @@ class WhatsAppService:
     def __new__(cls):
         if cls._instance is None:
             cls._instance = super(WhatsAppService, cls).__new__(cls)
+            # One page, one user at a time: senders and chat readers take turns
+            cls._instance.page_lock = asyncio.Lock()
         return cls._instance
 
     async def start(self, on_browser_close_callback=None):
@@ -22,7 +133,7 @@ class WhatsAppService:
             return
 
         self.on_browser_close_callback = on_browser_close_callback
-        print("Starting Playwright Service (Persistent Mode)...")
+        logger.info("Starting Playwright Service (Persistent Mode)...")
         self.playwright = await async_playwright().start()
         
         # Fixed User Agent
@@ -37,13 +148,13 @@ class WhatsAppService:
 
         # Custom Executable Path
         if config.BROWSER_EXECUTABLE_PATH:
-            print(f"Using custom executable: {config.BROWSER_EXECUTABLE_PATH}")
+            logger.info(f"Using custom executable: {config.BROWSER_EXECUTABLE_PATH}")
             launch_args["executable_path"] = config.BROWSER_EXECUTABLE_PATH
         
         elif config.BROWSER_CHANNEL:
              launch_args["channel"] = config.BROWSER_CHANNEL
 
-        print(f"Loading persistent context from: {config.USER_DATA_DIR}")
+        logger.info(f"Loading persistent context from: {config.USER_DATA_DIR}")
         
         # We use launch_persistent_context which automatically handles storage/cookies/indexedDB
         try:
@@ -55,7 +166,7 @@ class WhatsAppService:
             self.context.on("close", lambda: asyncio.create_task(self.on_context_closed()))
 
         except Exception as e:
-            print(f"Error launching persistent context: {e}")
+            logger.error(f"Error launching persistent context: {e}")
             # Fallback if channel fails or locked?
             raise e
 
@@ -69,57 +180,87 @@ class WhatsAppService:
         asyncio.create_task(self.process_queue_loop())
 
         try:
-            print(f"Navigating to {config.WHATSAPP_URL}")
+            logger.info(f"Navigating to {config.WHATSAPP_URL}")
             await self.page.goto(config.WHATSAPP_URL, timeout=60000)
         except Exception as e:
-            print(f"Error navigating: {e}")
+            logger.error(f"Error navigating: {e}")
 
     async def process_queue_loop(self):
         """Background task to process messages from SQLite Queue sequentially."""
-        print("🚀 Queue Consumer Started: Waiting for messages...")
+        logger.info("🚀 Queue Consumer Started: Waiting for messages...")
+        last_phone = None
+        streak = 0 # Consecutive sends to last_phone
         
         while True:
+            # Liveness signal for the supervisor (stops if a browser call hangs)
+            if self.on_heartbeat:
+                self.on_heartbeat()
+
             try:
-                # 1. Get next pending message
-                msg = queue_manager.get_next_pending()
+                # 1. Get next pending group (same phone first: its chat is already open,
+                # but only for MAX_CHAT_STREAK sends so other phones don't starve)
+                prefer_phone = last_phone if streak < MAX_CHAT_STREAK else None
+                batch = queue_manager.get_next_batch(prefer_phone=prefer_phone, coalesce_window=config.COALESCE_WINDOW, worker_id=self.worker_id)
                 
-                if msg:
-                    print(f"🔄 Processing Message ID {msg['id']} for {msg['phone']}...")
+                if batch:
+                    msg = batch[0]
+                    batch_ids = [m['id'] for m in batch]
+                    logger.info(f"🔄 Processing Message ID {batch_ids} for {msg['phone']}...")
                     
                     try:
+                        # 1.2 Known invalid number: fail without touching the browser
+                        if queue_manager.is_invalid_number(msg['phone']):
+                            raise InvalidNumberError(f"Numero {msg['phone']} no registrado en WhatsApp (cache)")
+
                         # 1.5 Check for Duplicates (Anti-Spam)
                         # Only if threshold > 0 (0 means disabled)
+                        to_send = batch
                         if config.SIMILARITY_THRESHOLD > 0:
                             threshold = config.SIMILARITY_THRESHOLD / 100.0
-                            is_dup, reason = queue_manager.check_duplicate(msg['phone'], msg['message'], exclude_id=msg['id'], threshold=threshold)
-                            
-                            if is_dup:
-                                print(f"🛑 SKIP Message ID {msg['id']}: {reason}")
-                                queue_manager.mark_completed(msg['id'], status='DUPLICATE', error=reason)
-                                continue
-
-                        # 2. Add random delay to look human and avoid race conditions
-                        await asyncio.sleep(2) 
-
-                        # 3. Send Message
-                        await self.send_message(msg['phone'], msg['message'], msg.get('image_path'))
+                            to_send = []
+                            for m in batch:
+                                is_dup, reason = queue_manager.check_duplicate(m['phone'], m['message'], exclude_id=batch_ids, threshold=threshold, signature=m.get('signature'))
+                                if is_dup:
+                                    logger.info(f"🛑 SKIP Message ID {m['id']}: {reason}")
+                                    queue_manager.mark_completed(m['id'], status='DUPLICATE', error=reason)
+                                else:
+                                    to_send.append(m)
+
+                        if not to_send:
+                            continue
+                        batch_ids = [m['id'] for m in to_send]
+
+                        # 2. Add random delay to look human and avoid race conditions (only when opening a new chat)
+                        if msg['phone'] != last_phone:
+                            await asyncio.sleep(2) 
+
+                        # 3. Send Message (returns the measured delivery state)
+                        # Coalesced text-only messages go out as a single message
+                        text = "\n\n".join(m['message'] for m in to_send)
+                        delivery_state = await self.send_message(msg['phone'], text, to_send[0].get('image_path'))
+                        streak = streak + 1 if msg['phone'] == last_phone else 1
+                        last_phone = msg['phone']
+                        if not delivery_state:
+                            raise Exception(self.last_send_error or "Envio fallido")
                         
                         # 4. Mark as SENT
-                        queue_manager.mark_completed(msg['id'], status='SENT')
-                        print(f"✅ Message ID {msg['id']} SENT successfully.")
+                        for msg_id in batch_ids:
+                            queue_manager.mark_completed(msg_id, status='SENT', delivery_state=delivery_state)
+                        logger.info(f"✅ Message ID {batch_ids} SENT successfully ({delivery_state}).")
                         
                         # Throttle: Wait a bit more after success
                         await asyncio.sleep(3) 
 
                     except Exception as e:
-                        print(f"❌ Error sending Message ID {msg['id']}: {e}")
-                        queue_manager.mark_completed(msg['id'], status='ERROR', error=str(e))
+                        logger.error(f"❌ Error sending Message ID {batch_ids}: {e}")
+                        for msg_id in batch_ids:
+                            queue_manager.mark_completed(msg_id, status='ERROR', error=str(e))
                 else:
                     # No messages, wait before polling again
                     await asyncio.sleep(3)
 
             except Exception as e:
-                print(f"⚠️ Safety Loop Error: {e}")
+                logger.exception(f"⚠️ Safety Loop Error: {e}")
                 await asyncio.sleep(5)
 
     async def get_status(self):
@@ -154,7 +295,7 @@ class WhatsAppService:
                 png_bytes = await element.screenshot()
                 return base64.b64encode(png_bytes).decode('utf-8')
         except Exception as e:
-            print(f"Error getting QR: {e}")
+            logger.error(f"Error getting QR: {e}")
         return None
 
     async def wait_for_login(self):
@@ -163,40 +304,97 @@ class WhatsAppService:
             return
             
         try:
-            print("Waiting for login (pane-side)...")
+            logger.info("Waiting for login (pane-side)...")
             
             # Check if we were logged out (QR code visible)
             try:
                 qr_code = self.page.locator('canvas[aria-label="Scan this QR code"]')
                 if await qr_code.count() > 0:
-                    print("⚠️ Session expired or invalid. Please scan QR code again.")
+                    logger.warning("⚠️ Session expired or invalid. Please scan QR code again.")
             except:
                 pass
 
             await self.page.wait_for_selector("#pane-side", timeout=0) 
-            print("Login detected! (Persistent session active)")
+            logger.info("Login detected! (Persistent session active)")
             # No need to manual save with persistent context
         except Exception as e:
-            print(f"Error waiting for login: {e}")
+            logger.error(f"Error waiting for login: {e}")
+
+    async def _last_outgoing(self):
+        """Snapshot of the last outgoing bubble in the open chat: {id, icon} or None."""
+        try:
+            return await self.page.evaluate(LAST_OUTGOING_JS)
+        except Exception:
+            return None
+
+    async def wait_for_send_confirmation(self, previous_id, timeout=None):
+        """
+        Wait until a new outgoing bubble appears and its clock icon turns into a tick.
+        Returns the delivery state: 'sent', 'delivered', 'read' or 'pending' (still clock on timeout).
+        Raises if no new bubble ever appeared.
+        """
+        timeout = timeout if timeout is not None else config.SEND_CONFIRM_TIMEOUT
+        try:
+            # Interval polling: requestAnimationFrame (the default) stops while the window is minimized
+            handle = await self.page.wait_for_function(
+                SEND_CONFIRMED_JS, arg=previous_id, timeout=timeout * 1000, polling=200
+            )
+            icon = await handle.json_value()
+            return DELIVERY_ICONS.get(icon, "sent")
+        except PlaywrightTimeoutError:
+            snap = await self._last_outgoing()
+            if snap and snap.get("id") != previous_id:
+                # The bubble exists but is still on the clock: WhatsApp will deliver it when it can
+                logger.warning(f"⚠️ Sin tick tras {timeout}s, mensaje queda pendiente en WhatsApp.")
+                return "pending"
+            raise Exception(f"No se detecto el mensaje enviado tras {timeout}s")
+
+    async def _open_chat(self, phone, text=""):
+        """Navigate to the chat for `phone` (optionally prefilling `text`). Raises InvalidNumberError."""
+        message_box = self.page.locator('div[contenteditable="true"][data-tab="10"]')
+        self.current_chat_phone = None
+        url = f"https://web.whatsapp.com/send?phone={phone}&text={quote(text)}"
+        logger.debug(f"Navigating to {url}")
+        await self.page.goto(url)
+        
+        # Wait for the main chat frame to load (or the invalid number dialog, whichever comes first)
+        logger.debug("Waiting for chat to load...")
+        invalid_dialog = self.page.locator('div[role="dialog"], div[data-animate-modal-popup="true"]').filter(has_text=INVALID_NUMBER_TEXT)
+        await message_box.or_(invalid_dialog).first.wait_for(state="visible", timeout=45000)
+        if await invalid_dialog.count() > 0:
+            raise InvalidNumberError(f"Numero {phone} no registrado en WhatsApp")
+        logger.debug("Chat loaded.")
+        await self.page.evaluate(TAG_CHAT_JS, phone)
+        self.current_chat_phone = phone
 
     async def send_message(self, phone, message, image_path=None):
+        """Send a message and wait for WhatsApp's confirmation. Returns the delivery state or False."""
+        async with self.page_lock:
+            return await self._send_message(phone, message, image_path)
+
+    async def _send_message(self, phone, message, image_path=None):
+        self.last_send_error = None
         if not self.page:
+            self.last_send_error = "Navegador no iniciado"
             return False
         
         try:
-            # Navigate to the chat
-            url = f"https://web.whatsapp.com/send?phone={phone}&text={message}"
-            print(f"Navigating to {url}")
-            await self.page.goto(url)
-            
-            # Wait for the main chat frame to load
-            print("Waiting for chat to load...")
             message_box = self.page.locator('div[contenteditable="true"][data-tab="10"]')
-            await message_box.wait_for(state="visible", timeout=45000)
-            print("Chat loaded.")
+
+            if await self._chat_is_open(phone):
+                # Same chat as the previous message: type instead of reopening it
+                # (with an image, text already in the compose box becomes its caption)
+                logger.debug(f"Reusing open chat for {phone}")
+                if message:
+                    await self._type_message(message_box, message)
+            else:
+                await self._open_chat(phone, message)
+
+            previous = await self._last_outgoing()
+            previous_id = previous.get("id") if previous else None
 
             if image_path:
-                print(f"Attaching image: {image_path}")
+                logger.debug(f"Attaching image: {image_path}")
                 attach_btn = self.page.locator('span[data-icon="plus"]')
                 await attach_btn.click()
                 
@@ -208,27 +406,50 @@ class WhatsAppService:
                 await send_btn.wait_for(state="visible", timeout=15000)
                 
                 await send_btn.click()
-                print("Image sent.")
-                await asyncio.sleep(3) # Wait for upload
+                delivery_state = await self.wait_for_send_confirmation(previous_id)
+                logger.debug(f"Image sent ({delivery_state}).")
                 self.log_message(phone, message if message else "Image Attachment", "success")
-                return True
+                return delivery_state
 
             # Text only flow
-            print("Sending text message...")
+            logger.debug("Sending text message...")
             await message_box.click() 
             await asyncio.sleep(0.5)
             await message_box.press("Enter")
             
-            await asyncio.sleep(2)
-            # No need to manual save
+            delivery_state = await self.wait_for_send_confirmation(previous_id)
+            logger.debug(f"Text sent ({delivery_state}).")
             
             self.log_message(phone, message, "success")
-            return True
+            return delivery_state
         except Exception as e:
-            print(f"Error sending msg: {e}")
+            logger.error(f"Error sending msg: {e}")
+            self.last_send_error = str(e)
+            if isinstance(e, InvalidNumberError):
+                queue_manager.mark_invalid_number(phone, str(e))
+            # Leftover text may remain in the compose box: reopen the chat next time
+            self.current_chat_phone = None
             self.log_message(phone, message, f"error: {str(e)}")
             return False
 
+    async def _chat_is_open(self, phone):
+        """True if the chat opened for `phone` is still the one on screen."""
+        if self.current_chat_phone != phone:
+            return False
+        try:
+            return bool(await self.page.evaluate(CHAT_IS_OPEN_JS, phone))
+        except Exception:
+            return False
+
+    async def _type_message(self, message_box, message):
+        """Type a (possibly multi-line) message into the compose box without sending it."""
+        await message_box.click()
+        for i, line in enumerate(message.split("\n")):
+            if i > 0:
+                await self.page.keyboard.press("Shift+Enter")
+            if line:
+                await self.page.keyboard.insert_text(line)
+
     def log_message(self, phone, message, status):
         try:
             import csv
@@ -255,10 +476,10 @@ class WhatsAppService:
                     if not file_exists:
                         writer.writerow(["Timestamp", "Phone", "Message", "Status"])
                     writer.writerow([timestamp, phone, message, status])
-                print(f"Logged to CSV: {csv_path}")
+                logger.debug(f"Logged to CSV: {csv_path}")
             
             except PermissionError:
-                print(f"⚠️ CSV Locked or Permission Denied: {csv_path}. Trying backup file...")
+                logger.warning(f"⚠️ CSV Locked or Permission Denied: {csv_path}. Trying backup file...")
                 # 3. Fallback: Create a unique backup file if main is locked (e.g. open in Excel)
                 backup_name = f"conversations_{datetime.now().strftime('%Y%m%d')}.csv"
                 backup_path = os.path.join(os.path.dirname(csv_path), backup_name)
@@ -266,25 +487,48 @@ class WhatsAppService:
                 with open(backup_path, mode='a', newline='', encoding='utf-8') as f:
                     writer = csv.writer(f)
                     writer.writerow([timestamp, phone, message, status])
-                print(f"✅ Logged to BACKUP CSV: {backup_path}")
+                logger.info(f"✅ Logged to BACKUP CSV: {backup_path}")
 
         except Exception as e:
-            print(f"❌ Error logging to CSV (All attempts failed): {e}")
+            logger.error(f"❌ Error logging to CSV (All attempts failed): {e}")
             
-    async def get_messages(self, phone):
-        pass
+    async def get_messages(self, phone, after=None, limit=50):
+        """
+        Read the chat with `phone` incrementally.
+        after: cursor (data-id of the last message already seen). None = the latest `limit` messages.
+        Extraction is a single in-page evaluate, so a poll costs as much as its new messages.
+        Returns: {"messages": [...], "cursor": ..., "has_more": bool, "cursor_found": bool}
+        Raises InvalidNumberError / RuntimeError.
+        """
+        async with self.page_lock:
+            if not self.page:
+                raise RuntimeError("Navegador no iniciado")
+
+            if not await self._chat_is_open(phone):
+                try:
+                    await self._open_chat(phone)
+                except InvalidNumberError as e:
+                    queue_manager.mark_invalid_number(phone, str(e))
+                    raise
+
+            result = await self.page.evaluate(READ_MESSAGES_JS, [after, limit])
+
+        messages = result["messages"]
+        result["cursor"] = messages[-1]["id"] if messages else after
+        return result
 
     async def on_context_closed(self):
-        print("⚠️ Browser Context Closed!")
+        logger.warning("⚠️ Browser Context Closed!")
+        self.current_chat_phone = None
         self.page = None
         self.context = None
         
         if self.on_browser_close_callback:
-            print("Triggering on_browser_close_callback...")
+            logger.info("Triggering on_browser_close_callback...")
             await self.on_browser_close_callback()
 
     async def close(self):
-        print("Closing Playwright Service...")
+        logger.info("Closing Playwright Service...")
         if self.context:
             await self.context.close()
         if self.playwright:
@@ -0,0 +1,114 @@
+import asyncio
+import time
+
+from app.core import config
+from app.services import minhash
+from app.services.queue_manager import queue_manager
+from app.core.log import get_logger
+
+logger = get_logger(__name__)
+
+
+class WriteBehindBuffer:
+    """
+    Staging buffer for socket bursts.
+    Messages are accepted into memory and written to message_queue in a single
+    transaction every WRITE_BEHIND_MS milliseconds (or as soon as WRITE_BEHIND_MAX_ROWS
+    are waiting), so a burst costs one commit instead of one per event.
+    """
+
+    def __init__(self):
+        self.items = [] # (phone, message, image_path, send_at, signature, future)
+        self.wakeup = None
+        self.task = None
+
+    def start(self):
+        if self.task:
+            return
+        self.wakeup = asyncio.Event()
+        self.task = asyncio.create_task(self.run())
+
+    async def submit(self, phone, message, image_path=None, send_at=None, signature=None):
+        """
+        Stage a message. Returns its queue id once the group it belongs to is committed.
+        signature: minhash.signature(message), computed once by the caller and stored as is.
+        """
+        if not self.task or config.WRITE_BEHIND_MS <= 0:
+            return queue_manager.add_message(phone, message, image_path, send_at=send_at, signature=signature)
+
+        if signature is None:
+            signature = minhash.signature(message)
+        future = asyncio.get_running_loop().create_future()
+        self.items.append((phone, message, image_path, send_at, signature, future))
+
+        if len(self.items) >= config.WRITE_BEHIND_MAX_ROWS:
+            # Bounded: a full buffer is written right away
+            self.flush()
+        else:
+            self.wakeup.set()
+        return await future
+
+    def check_duplicate(self, phone, message, threshold, signature=None):
+        """
+        Same rule as queue_manager.check_duplicate, for messages still in the buffer.
+        Compares against the signatures staged with each item (no recomputation per item).
+        """
+        text = minhash.normalize(message)
+        sig = signature
+        now = time.time()
+        for item_phone, item_message, _, item_send_at, item_sig, _ in self.items:
+            # Scheduled messages are checked when they become due
+            if item_phone != phone or (item_send_at and item_send_at > now):
+                continue
+            if minhash.normalize(item_message) == text:
+                return True, "Duplicado exacto (en cola de escritura)"
+            if threshold >= 1.0:
+                continue
+            if sig is None:
+                sig = minhash.signature(message)
+            if minhash.similarity(sig, item_sig) >= threshold:
+                return True, "Duplicado similar (en cola de escritura)"
+        return False, None
+
+    def flush(self):
+        """Write everything staged in one transaction and resolve the waiting futures."""
+        if not self.items:
+            return
+        batch, self.items = self.items, []
+        try:
+            ids = queue_manager.add_messages([item[:5] for item in batch])
+        except Exception as e:
+            logger.error(f"❌ Error escribiendo lote de {len(batch)} mensajes: {e}")
+            for *_, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for msg_id, (*_, future) in zip(ids, batch):
+            if not future.done():
+                future.set_result(msg_id)
+        if len(batch) > 1:
+            logger.info(f"💾 Lote de {len(batch)} mensajes guardado (1 commit)")
+
+    async def run(self):
+        while True:
+            try:
+                await self.wakeup.wait()
+                # Give the rest of the burst a few ms to arrive
+                await asyncio.sleep(config.WRITE_BEHIND_MS / 1000.0)
+                self.wakeup.clear()
+                self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"⚠️ Write-behind Error: {e}")
+                await asyncio.sleep(1)
+
+    def stop(self):
+        """Flush whatever is still staged (called on shutdown)."""
+        if self.task:
+            self.task.cancel()
+            self.task = None
+        self.flush()
+
+
+write_buffer = WriteBehindBuffer()
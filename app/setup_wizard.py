@@ -21,8 +21,18 @@ PORT = 8000
 RUC = 00000000000
 # Token de Seguridad (Debe coincidir con auth.json del servidor)
 TOKEN =
-# Similitud para detectar duplicados (0-100). 0 para desactivar.
+# Similitud para detectar duplicados (0-100): % de fragmentos de texto en común. 100 = solo exacto, 0 para desactivar.
 SIMILARITY_THRESHOLD = 90
+# Intervalo (segundos) para reportar el estado de la cola al servidor. 0 para desactivar.
+STATS_INTERVAL = 15
+# Segundos maximos esperando el check de enviado (reloj -> check)
+SEND_CONFIRM_TIMEOUT = 30
+# Une mensajes de texto al mismo numero encolados dentro de N segundos. 0 para desactivar.
+COALESCE_WINDOW = 0
+# Segundos que se recuerda un numero sin WhatsApp (se rechaza sin abrir el navegador). 0 para desactivar.
+INVALID_NUMBER_TTL = 86400
+# Segundos entre envios de estados de mensajes (SENT/ERROR/DUPLICATE) al servidor
+OUTBOX_FLUSH_INTERVAL = 2
 # URL del Servidor Socket.IO (Node.js)
 SOCKET_URL = http://jsjperu.net:8000
 
@@ -37,6 +47,18 @@ CHANNEL = chrome
 # Example: C:\\Program Files\\Google\\Chrome\\Application\\chrome.exe
 # EXECUTABLE_PATH = 
 EXECUTABLE_PATH =
+
+[Logging]
+# Nivel: DEBUG, INFO, WARNING, ERROR (archivos en la carpeta logs)
+LEVEL = INFO
+
+[Supervisor]
+# Navegador en procesos separados, reiniciados si se caen o se cuelgan (tambien: run.py --supervisor)
+ENABLED = False
+# Procesos de envio (cada uno necesita su propia sesion de WhatsApp)
+WORKERS = 1
+# Segundos sin heartbeat para considerar un worker colgado
+HANG_TIMEOUT = 300
 """
 
 def create_default_config():
@@ -0,0 +1,179 @@
+import base64
+import multiprocessing
+import os
+import threading
+import time
+
+from app.core import config
+from app.services.queue_manager import queue_manager
+from app.worker import run_worker, qr_file, STATUS_NAMES, STATUS_CODES, EXIT_BROWSER_CLOSED
+from app.core.log import get_logger
+
+logger = get_logger(__name__)
+
+# Always spawn (the Windows default): a forked child would inherit the parent's
+# logging listener state and sqlite handles
+_mp = multiprocessing.get_context("spawn")
+
+# Restart backoff for workers that keep dying (seconds)
+MIN_BACKOFF = 2
+MAX_BACKOFF = 60
+
+
+class WorkerHandle:
+    def __init__(self, worker_id):
+        self.worker_id = worker_id
+        self.process = None
+        self.heartbeat = _mp.Value('d', 0.0)
+        self.status = _mp.Value('i', 0)
+        self.restarts = 0
+        self.backoff = MIN_BACKOFF
+        self.next_start = 0.0
+
+
+class Supervisor:
+    """
+    Runs the browser sender workers as child processes and restarts them when
+    they die or stop sending heartbeats, so intake never blocks on the browser.
+    """
+
+    def __init__(self):
+        self.workers = []
+        self.running = False
+        self.thread = None
+        self.on_worker_exit = None
+
+    def start(self, on_worker_exit=None):
+        """on_worker_exit(worker_id, exitcode): called from the monitor thread when a worker ends."""
+        if self.running:
+            return
+        self.on_worker_exit = on_worker_exit
+        self.workers = [WorkerHandle(i) for i in range(max(1, config.SENDER_WORKERS))]
+        self.running = True
+
+        # Rows left in PROCESSING by a previous run can't be trusted
+        queue_manager.release_stuck()
+
+        for handle in self.workers:
+            self._spawn(handle)
+
+        self.thread = threading.Thread(target=self._monitor, name="supervisor", daemon=True)
+        self.thread.start()
+        logger.info(f"🧭 Supervisor iniciado con {len(self.workers)} worker(s)")
+
+    def _spawn(self, handle):
+        handle.heartbeat.value = time.time()
+        handle.status.value = 0
+        # A QR left by the previous process is stale
+        try:
+            os.remove(qr_file(handle.worker_id))
+        except OSError:
+            pass
+        handle.process = _mp.Process(
+            target=run_worker,
+            args=(handle.worker_id, handle.heartbeat, handle.status),
+            name=f"sender-{handle.worker_id}",
+            daemon=True,
+        )
+        handle.process.start()
+        logger.info(f"👷 Worker {handle.worker_id} lanzado (PID {handle.process.pid})")
+
+    def _stop_process(self, handle):
+        proc = handle.process
+        if proc is None or not proc.is_alive():
+            return
+        proc.terminate()
+        proc.join(5)
+        if proc.is_alive():
+            proc.kill()
+            proc.join(5)
+
+    def _monitor(self):
+        while self.running:
+            now = time.time()
+            for handle in self.workers:
+                proc = handle.process
+
+                if proc is not None and proc.is_alive():
+                    if now - handle.heartbeat.value <= config.WORKER_HANG_TIMEOUT:
+                        # Healthy for a while: forget previous failures
+                        if now - handle.next_start > MAX_BACKOFF:
+                            handle.backoff = MIN_BACKOFF
+                        continue
+                    logger.warning(f"⚠️ Worker {handle.worker_id} sin heartbeat hace {int(now - handle.heartbeat.value)}s. Reiniciando...")
+                    self._stop_process(handle)
+
+                if proc is not None:
+                    exitcode = proc.exitcode
+                    handle.process = None
+                    if exitcode == EXIT_BROWSER_CLOSED:
+                        logger.info(f"🔴 Worker {handle.worker_id}: navegador cerrado por el usuario")
+                    else:
+                        logger.error(f"❌ Worker {handle.worker_id} terminó (exitcode {exitcode})")
+                    queue_manager.release_stuck(handle.worker_id)
+                    if self.on_worker_exit:
+                        try:
+                            self.on_worker_exit(handle.worker_id, exitcode)
+                        except Exception as e:
+                            logger.error(f"⚠️ Error en on_worker_exit: {e}")
+                    handle.next_start = now + handle.backoff
+                    handle.backoff = min(handle.backoff * 2, MAX_BACKOFF)
+
+                if self.running and now >= handle.next_start:
+                    handle.restarts += 1
+                    self._spawn(handle)
+                    handle.next_start = now
+
+            time.sleep(1)
+
+    def snapshot(self):
+        """Worker states for the status endpoints."""
+        now = time.time()
+        return [
+            {
+                "worker_id": h.worker_id,
+                "pid": h.process.pid if h.process else None,
+                "alive": bool(h.process and h.process.is_alive()),
+                "status": STATUS_NAMES.get(h.status.value, "loading"),
+                "heartbeat_age": round(now - h.heartbeat.value, 1),
+                "restarts": h.restarts,
+            }
+            for h in self.workers
+        ]
+
+    def get_status(self):
+        """Best WhatsApp status across workers (same values as WhatsAppService.get_status)."""
+        statuses = [s["status"] for s in self.snapshot() if s["alive"]]
+        for candidate in ("connected", "waiting_qr", "loading"):
+            if candidate in statuses:
+                return candidate
+        return "not_initialized"
+
+    def get_qr(self):
+        """
+        QR published by the first live worker waiting for a scan.
+        Returns: (worker_id, base64 PNG), or (None, None) if no worker has one.
+        """
+        for handle in self.workers:
+            if not (handle.process and handle.process.is_alive()):
+                continue
+            if handle.status.value != STATUS_CODES["waiting_qr"]:
+                continue
+            try:
+                with open(qr_file(handle.worker_id), "rb") as f:
+                    return handle.worker_id, base64.b64encode(f.read()).decode('utf-8')
+            except OSError:
+                continue
+        return None, None
+
+    def stop(self):
+        """Blocks up to several seconds per worker: call it from a thread in async code."""
+        self.running = False
+        if self.thread:
+            self.thread.join(5)
+        for handle in self.workers:
+            self._stop_process(handle)
+        logger.info("🧭 Supervisor detenido")
+
+
+supervisor = Supervisor()
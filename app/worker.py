@@ -0,0 +1,105 @@
+import asyncio
+import base64
+import os
+import sys
+import tempfile
+import time
+
+from app.core.log import get_logger, setup_logging
+
+logger = get_logger(__name__)
+
+# Sender worker process (supervisor mode).
+# Owns the Playwright browser and consumes message_queue; intake lives in the parent.
+
+# Status codes shared with the supervisor through a multiprocessing.Value
+STATUS_CODES = {"not_initialized": 0, "loading": 1, "waiting_qr": 2, "connected": 3}
+STATUS_NAMES = {code: name for name, code in STATUS_CODES.items()}
+
+# Exit code used when the user closed the browser window
+EXIT_BROWSER_CLOSED = 3
+
+# Folder where workers publish their login QR for the parent's /qr endpoint
+QR_DIR = os.path.join(tempfile.gettempdir(), "ControlWHA")
+
+
+def qr_file(worker_id):
+    """PNG of the QR currently shown by `worker_id` (only exists while it waits for a scan)."""
+    return os.path.join(QR_DIR, f"qr_worker{worker_id}.png")
+
+
+async def _publish_qr(worker_id, service, current_status):
+    """Write the QR screenshot while waiting for a scan, remove it otherwise."""
+    path = qr_file(worker_id)
+    if current_status != "waiting_qr":
+        if os.path.exists(path):
+            os.remove(path)
+        return
+    qr_base64 = await service.get_qr()
+    if not qr_base64:
+        return
+    os.makedirs(QR_DIR, exist_ok=True)
+    # Write then rename so the parent never reads a half-written file
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(base64.b64decode(qr_base64))
+    os.replace(tmp_path, path)
+
+
+def run_worker(worker_id, heartbeat, status):
+    """
+    Process entry point (must be top-level so it can be spawned on Windows).
+    heartbeat: multiprocessing.Value('d'), last time the queue consumer looped.
+    status: multiprocessing.Value('i'), WhatsApp status code (STATUS_CODES).
+    """
+    if sys.platform == 'win32':
+        asyncio.set_event_loop_policy(asyncio.WindowsProactorEventLoopPolicy())
+
+    from app.core import config
+
+    # Each extra worker needs its own browser profile (and its own WhatsApp session)
+    if worker_id > 0:
+        config.USER_DATA_DIR = f"{config.USER_DATA_DIR}_{worker_id}"
+
+    # Own log file: processes can't share a rotating file on Windows
+    setup_logging(f"control-wha-worker{worker_id}.log")
+
+    sys.exit(asyncio.run(_worker_main(worker_id, heartbeat, status)))
+
+
+async def _worker_main(worker_id, heartbeat, status):
+    from app.services.whatsapp import service
+
+    logger.info(f"👷 Worker {worker_id} iniciado")
+    browser_closed = asyncio.Event()
+
+    async def on_browser_closed():
+        browser_closed.set()
+
+    def beat():
+        heartbeat.value = time.time()
+
+    service.worker_id = worker_id
+    service.on_heartbeat = beat
+    beat()
+
+    await service.start(on_browser_close_callback=on_browser_closed)
+    asyncio.create_task(service.wait_for_login())
+
+    # Publish WhatsApp status (and the QR while waiting for a scan) until the browser goes away
+    while not browser_closed.is_set():
+        try:
+            current_status = await service.get_status()
+            status.value = STATUS_CODES.get(current_status, 0)
+            await _publish_qr(worker_id, service, current_status)
+        except Exception as e:
+            logger.warning(f"⚠️ Worker {worker_id}: error leyendo estado: {e}")
+        try:
+            await asyncio.wait_for(browser_closed.wait(), timeout=5)
+        except asyncio.TimeoutError:
+            pass
+
+    logger.info(f"🔴 Worker {worker_id}: navegador cerrado, saliendo...")
+    await _publish_qr(worker_id, service, "not_initialized")
+    await service.close()
+    return EXIT_BROWSER_CLOSED
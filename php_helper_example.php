@@ -9,7 +9,9 @@ if (!function_exists('enviar_whatsapp')) {
      * @param string $celular Número de destino (519...)
      * @param string $mensaje Texto del mensaje
      * @param string $imagen (Opcional) URL o Path de imagen
-     * @return bool|array Respuesta del servidor
+     * @return bool|array Respuesta del servidor. 'ack' trae el ID en cola del cliente
+     *                    (o null si el cliente no confirmó a tiempo: NO reintentar, puede estar encolado).
+     *                    false si fue rechazado (422), cliente saturado (429) o error de red.
      */
     function enviar_whatsapp($ruc, $celular, $mensaje, $imagen = null) {
         // URL de tu servidor Node.js (Asegúrate que el puerto coincida, por defecto es 3000 o 8000)
@@ -2,11 +2,15 @@ import asyncio
 import sys
 import uvicorn
 import importlib
+import multiprocessing
 
 # NOTE: Do NOT import app.main or app.core.config here globally.
 # They read config.ini on import. We must run the setup wizard first!
 
 if __name__ == "__main__":
+    # Required for child worker processes in the frozen (PyInstaller) exe
+    multiprocessing.freeze_support()
+
     # 1. Run Setup Wizard (GUI) if needed
     from app import setup_wizard
     setup_wizard.run_wizard()
@@ -14,11 +18,20 @@ if __name__ == "__main__":
     # 2. Now it's safe to import the app, as config.ini is ready
     from app.main import app
     from app.core import config
+    from app.core.log import get_logger
+
+    logger = get_logger(__name__)
+
+    # Supervisor mode: "--supervisor" flag or [Supervisor] ENABLED = True in config.ini
+    if "--supervisor" in sys.argv:
+        config.SUPERVISOR = True
+    if config.SUPERVISOR:
+        logger.info(f"🧭 Modo supervisor: {config.SENDER_WORKERS} worker(s) de envio en procesos separados")
 
     # Enforce ProactorEventLoopPolicy on Windows for Playwright
     if sys.platform == 'win32':
         asyncio.set_event_loop_policy(asyncio.WindowsProactorEventLoopPolicy())
     
     # Run Uvicorn directly with the app instance
-    print(f"Starting server on port {config.PORT}...")
+    logger.info(f"Starting server on port {config.PORT}...")
     uvicorn.run(app, host="0.0.0.0", port=config.PORT, reload=False)
@@ -49,6 +49,25 @@ const saveAuth = (data) => {
     }
 };
 
+// --- MESSAGE STATUS (reported by clients through their outbox) ---
+// Optional ERP webhook that receives every status batch
+const STATUS_WEBHOOK_URL = process.env.STATUS_WEBHOOK_URL || '';
+// Last statuses kept in memory per RUC
+const STATUS_HISTORY = parseInt(process.env.STATUS_HISTORY || '1000', 10);
+const messageStatus = new Map(); // ruc -> Map(msg_id -> event)
+
+const storeStatus = (ruc, events) => {
+    if (!messageStatus.has(ruc)) messageStatus.set(ruc, new Map());
+    const history = messageStatus.get(ruc);
+    for (const ev of events) {
+        history.delete(ev.msg_id); // Re-insert to keep newest last
+        history.set(ev.msg_id, ev);
+    }
+    while (history.size > STATUS_HISTORY) {
+        history.delete(history.keys().next().value);
+    }
+};
+
 // Middleware to track connection time or other metadata if needed
 io.use((socket, next) => {
   socket.connectedAt = new Date();
@@ -96,6 +115,37 @@ io.on('connection', (socket) => {
     }
   });
 
+  // Batched per-message statuses. ACK only once stored (and forwarded), the client replays otherwise.
+  socket.on('message_status_batch', async (data, ack) => {
+      const reply = typeof ack === 'function' ? ack : () => {};
+      if (!data || !socket.ruc || String(data.ruc) !== String(socket.ruc) || !Array.isArray(data.events)) {
+          return reply({ ok: false, error: "No registrado o datos invalidos" });
+      }
+
+      if (STATUS_WEBHOOK_URL) {
+          try {
+              const resp = await fetch(STATUS_WEBHOOK_URL, {
+                  method: 'POST',
+                  headers: { 'Content-Type': 'application/json' },
+                  body: JSON.stringify({ ruc: socket.ruc, events: data.events })
+              });
+              if (!resp.ok) throw new Error(`HTTP ${resp.status}`);
+          } catch (e) {
+              console.error(`Error enviando estados al webhook: ${e.message}`);
+              return reply({ ok: false, error: "Webhook no disponible" });
+          }
+      }
+
+      storeStatus(socket.ruc, data.events);
+      console.log(`📬 ${data.events.length} estados recibidos de RUC ${socket.ruc}`);
+      reply({ ok: true, count: data.events.length });
+  });
+
+  // Queue depth / throughput reported periodically by the client (backpressure)
+  socket.on('queue_stats', (data) => {
+      socket.queueStats = { ...data, receivedAt: new Date() };
+  });
+
   // Broadcast Client Status (e.g. Browser Closed)
   socket.on('client_status', (data) => {
       console.log(`📢 Client Status Update [${data.ruc}]:`, data.status);
@@ -109,24 +159,82 @@ io.on('connection', (socket) => {
   });
 });
 
+// Backpressure: max PENDING messages a client may have before we refuse new ones (0 = disabled)
+const MAX_BACKLOG = parseInt(process.env.MAX_BACKLOG || '0', 10);
+// How long to wait for the client ACK (queue ID or rejection)
+const ACK_TIMEOUT_MS = parseInt(process.env.ACK_TIMEOUT_MS || '5000', 10);
+
+const getRoomBacklog = (room) => {
+  const ids = io.sockets.adapter.rooms.get(room);
+  if (!ids) return null;
+  for (const id of ids) {
+    const s = io.sockets.sockets.get(id);
+    if (s && s.queueStats) return s.queueStats;
+  }
+  return null;
+};
+
 // endpoint for sending messages
 app.post('/api/venta', (req, res) => {
-  const { ruc, phone_number, message, image_path } = req.body;
+  const { ruc, phone_number, message, image_path, send_at } = req.body;
 
   if (!ruc || !phone_number || !message) {
     return res.status(400).json({ error: "Faltan datos (ruc, phone_number, message)" });
   }
 
   console.log(`Recibida venta para RUC ${ruc} -> Tel: ${phone_number}`);
+
+  const room = `ruc_${ruc}`;
+  const stats = getRoomBacklog(room);
+  if (MAX_BACKLOG > 0 && stats && stats.pending >= MAX_BACKLOG) {
+    console.log(`⏳ RUC ${ruc} saturado (${stats.pending} pendientes). Rechazando.`);
+    return res.status(429).json({ error: "Cliente saturado, reintente luego", queue: stats });
+  }
   
-  // Emit to specific room
-  io.to(`ruc_${ruc}`).emit('enviar_whatsapp', {
+  // Emit to specific room and wait for the client ACK
+  io.to(room).timeout(ACK_TIMEOUT_MS).emit('enviar_whatsapp', {
     phone_number,
     message,
-    image_path
+    image_path,
+    send_at // Optional: ISO 8601 or epoch, the client holds it until then
+  }, (err, responses) => {
+    const ack = (responses && responses.length > 0) ? responses[0] : null;
+
+    if (err || !ack) {
+      // No client answered in time: the event may already be queued, so answer 200
+      // (a retry from the ERP could send it twice). "ack: null" marks it as unconfirmed.
+      return res.json({ status: "Evento emitido a RUC " + ruc + " (sin confirmacion)", ack: null, data: req.body });
+    }
+
+    if (ack.status === 'rejected') {
+      return res.status(422).json({ error: "Mensaje rechazado por el cliente", ack, data: req.body });
+    }
+
+    res.json({ status: "Mensaje encolado en RUC " + ruc, id: ack.id, ack, data: req.body });
   });
+});
+
+// Estado de mensajes reportado por el cliente (?ruc=...&id=... opcional)
+// Requiere el token del RUC (auth.json), en el header "x-token" o en ?token=
+app.get('/api/estado', (req, res) => {
+  const { ruc, id } = req.query;
+  if (!ruc) return res.status(400).json({ error: "Falta RUC" });
+
+  const validToken = getAuth()[ruc];
+  const providedToken = req.get('x-token') || req.query.token;
+  if (!validToken || validToken !== providedToken) {
+    return res.status(401).json({ error: "Token inválido o RUC no autorizado" });
+  }
+
+  const history = messageStatus.get(String(ruc));
+  if (!history) return res.json({ count: 0, events: [] });
 
-  res.json({ status: "Evento emitido a RUC " + ruc, data: req.body });
+  if (id) {
+    const ev = history.get(Number(id));
+    return ev ? res.json(ev) : res.status(404).json({ error: "Sin estado para ese mensaje" });
+  }
+  const events = Array.from(history.values());
+  res.json({ count: events.length, events });
 });
 
 // 1. Ver conexiones activas
@@ -139,6 +247,7 @@ app.get('/api/clients', (req, res) => {
       id: id,
       ruc: socket.ruc || "Anónimo",
       connectedAt: socket.connectedAt,
+      queue: socket.queueStats || null,
       address: socket.handshake.address
     });
   }
@@ -0,0 +1,27 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# Keep the module-level queue_manager (created at import) out of the project folder,
+# and give init_db the Windows folders it expects
+_tmp = tempfile.mkdtemp(prefix="control-wha-tests-")
+for _env in ("APPDATA", "LOCALAPPDATA"):
+    os.environ.setdefault(_env, _tmp)
+
+from app.core import config  # noqa: E402
+
+config.EXEC_DIR = Path(_tmp)
+
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    """QueueManager on an empty database of its own."""
+    from app.services import queue_manager as qm
+
+    monkeypatch.setattr(qm, "DB_PATH", tmp_path / "messages.sqlite")
+    return qm.QueueManager()
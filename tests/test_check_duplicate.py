@@ -0,0 +1,53 @@
+from app.services import queue_manager as qm
+
+ORDER = "Hola Juan, su pedido #1234 por S/ 150.00 fue registrado correctamente. Gracias por su compra."
+
+
+def test_exact_duplicate(manager):
+    manager.add_message("51999999999", ORDER)
+    new_id = manager.add_message("51999999999", "  " + ORDER.lower())
+    is_dup, reason = manager.check_duplicate("51999999999", ORDER, new_id, threshold=0.9, include_pending=True)
+    assert is_dup
+    assert "exacto" in reason
+
+
+def test_near_duplicate_at_default_threshold(manager):
+    manager.add_message("51999999999", ORDER)
+    # Final period dropped: ~99% of the 4-character shingles are shared
+    variant = ORDER.rstrip(".")
+    is_dup, reason = manager.check_duplicate("51999999999", variant, -1, threshold=0.9, include_pending=True)
+    assert is_dup
+    assert "similar" in reason
+
+
+def test_different_message_is_not_duplicate(manager):
+    manager.add_message("51999999999", ORDER)
+    other = "Estimado cliente, le recordamos que su cuota vence mañana. Saludos."
+    assert manager.check_duplicate("51999999999", other, -1, threshold=0.9, include_pending=True) == (False, None)
+
+
+def test_other_phone_is_not_duplicate(manager):
+    manager.add_message("51999999999", ORDER)
+    assert manager.check_duplicate("51888888888", ORDER, -1, threshold=0.9, include_pending=True) == (False, None)
+
+
+def test_exact_only_threshold(manager):
+    manager.add_message("51999999999", ORDER)
+    variant = ORDER.rstrip(".")
+    assert manager.check_duplicate("51999999999", variant, -1, threshold=1.0, include_pending=True) == (False, None)
+
+
+def test_pending_rows_ignored_unless_requested(manager):
+    manager.add_message("51999999999", ORDER)
+    assert manager.check_duplicate("51999999999", ORDER, -1, threshold=0.9) == (False, None)
+
+
+def test_rows_without_signature(manager):
+    # Rows stored before the signature column existed
+    msg_id = manager.add_message("51999999999", ORDER)
+    conn = qm.sqlite3.connect(str(qm.DB_PATH))
+    conn.execute("UPDATE message_queue SET signature=NULL WHERE id=?", (msg_id,))
+    conn.commit()
+    conn.close()
+    variant = ORDER.rstrip(".")
+    assert manager.check_duplicate("51999999999", variant, -1, threshold=0.9, include_pending=True)[0]
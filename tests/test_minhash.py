@@ -0,0 +1,36 @@
+from app.services import minhash
+
+ORDER = "Hola Juan, su pedido #1234 por S/ 150.00 fue registrado correctamente. Gracias por su compra."
+OTHER = "Estimado cliente, le recordamos que su cuota vence mañana. Saludos."
+
+
+def jaccard(a, b):
+    sa = minhash._shingles(minhash.normalize(a))
+    sb = minhash._shingles(minhash.normalize(b))
+    return len(sa & sb) / len(sa | sb)
+
+
+def test_signature_is_stable_bytes():
+    sig = minhash.signature(ORDER)
+    assert isinstance(sig, bytes)
+    assert sig == minhash.signature(ORDER)
+
+
+def test_formatting_noise_is_ignored():
+    assert minhash.similarity(minhash.signature(ORDER), minhash.signature("  " + ORDER.upper() + "\n")) == 1.0
+
+
+def test_similarity_estimates_jaccard():
+    for a, b in [
+        (ORDER, ORDER.replace("1234", "1235")),
+        (ORDER, ORDER.replace("Juan", "Pedro")),
+        (ORDER, ORDER[:60]),
+        (ORDER, OTHER),
+    ]:
+        estimate = minhash.similarity(minhash.signature(a), minhash.signature(b))
+        # ~3 standard errors with 64 slots
+        assert abs(estimate - jaccard(a, b)) <= 0.2
+
+
+def test_unrelated_messages_score_low():
+    assert minhash.similarity(minhash.signature(ORDER), minhash.signature(OTHER)) < 0.2
@@ -0,0 +1,95 @@
+import time
+
+from app.services import minhash
+from app.services import queue_manager as qm
+
+
+def test_coalesce_merges_texts_in_window(manager):
+    first = manager.add_message("51999999999", "Factura")
+    second = manager.add_message("51999999999", "Link de pago")
+    manager.add_message("51888888888", "Otro cliente")
+    batch = manager.get_next_batch(coalesce_window=60)
+    assert [m['id'] for m in batch] == [first, second]
+
+
+def test_coalesce_stops_at_pending_image(manager):
+    # Invoice, delivery guide (image), payment link: must go out in that order
+    text1 = manager.add_message("51999999999", "Factura")
+    image = manager.add_message("51999999999", "Guia", image_path="guia.png")
+    text2 = manager.add_message("51999999999", "Link de pago")
+
+    assert [m['id'] for m in manager.get_next_batch(coalesce_window=60)] == [text1]
+    assert [m['id'] for m in manager.get_next_batch(coalesce_window=60)] == [image]
+    assert [m['id'] for m in manager.get_next_batch(coalesce_window=60)] == [text2]
+    assert manager.get_next_batch(coalesce_window=60) == []
+
+
+def test_add_messages_keeps_given_signature(manager):
+    sig = minhash.signature("Factura")
+    given, computed = manager.add_messages([
+        ("51999999999", "Factura", None, None, sig),
+        ("51999999999", "Link de pago", None, None, None),
+    ])
+    batch = manager.get_next_batch(coalesce_window=60)
+    stored = {m['id']: m['signature'] for m in batch}
+    assert stored[given] == sig
+    assert stored[computed] == minhash.signature("Link de pago")
+
+
+def _execute(sql, params=()):
+    conn = qm.sqlite3.connect(str(qm.DB_PATH))
+    conn.execute(sql, params)
+    conn.commit()
+    conn.close()
+
+
+def _count(manager, status):
+    return manager.get_counters().get(status, 0)
+
+
+def test_counters_follow_insert_status_change_and_delete(manager):
+    ids = manager.add_messages([("51999999999", f"Mensaje {i}", None, None, None) for i in range(3)])
+    manager.add_message("51999999999", "Recordatorio", send_at=time.time() + 3600)
+    assert _count(manager, 'PENDING') == 3
+    assert _count(manager, 'SCHEDULED') == 1
+
+    batch = manager.get_next_batch()
+    assert _count(manager, 'PENDING') == 2
+    assert _count(manager, 'PROCESSING') == 1
+
+    manager.mark_completed(batch[0]['id'], status='SENT')
+    assert _count(manager, 'PROCESSING') == 0
+    assert _count(manager, 'SENT') == 1
+
+    _execute("DELETE FROM message_queue WHERE id IN (?, ?)", (batch[0]['id'], ids[2]))
+    assert _count(manager, 'SENT') == 0
+    assert _count(manager, 'PENDING') == 1
+    assert _count(manager, 'SCHEDULED') == 1
+
+
+def _pages(manager, **filters):
+    seen, cursor = [], None
+    while True:
+        rows, cursor = manager.list_messages(cursor=cursor, limit=2, **filters)
+        seen.extend(r['id'] for r in rows)
+        if not cursor:
+            return seen
+
+
+def test_pagination_across_tied_timestamps(manager):
+    # One group commit: every row shares the same created_at
+    items = [(phone, f"Mensaje {i}", None, None, None) for i in range(7) for phone in ("51999999999", "51888888888")]
+    ids = manager.add_messages(items)
+    claimed = manager.get_next_batch()[0]['id']  # -> PROCESSING
+
+    all_ids = _pages(manager)
+    assert all_ids == sorted(ids, reverse=True)
+
+    phone_ids = _pages(manager, phone="51888888888")
+    assert phone_ids == sorted((i for i, (phone, *_) in zip(ids, items) if phone == "51888888888"), reverse=True)
+
+    pending = _pages(manager, status="PENDING")
+    assert pending == sorted((i for i in ids if i != claimed), reverse=True)
+
+    both = _pages(manager, status="PENDING", phone="51999999999")
+    assert both == sorted((i for i, (phone, *_) in zip(ids, items) if phone == "51999999999" and i != claimed), reverse=True)
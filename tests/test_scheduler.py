@@ -0,0 +1,86 @@
+import asyncio
+import time
+from datetime import datetime, timezone
+
+import pytest
+
+from app.services import queue_manager as qm
+from app.services import scheduler as scheduler_module
+from app.services.scheduler import Scheduler, parse_send_at
+
+
+def test_parse_send_at_empty():
+    assert parse_send_at(None) is None
+    assert parse_send_at("") is None
+
+
+def test_parse_send_at_epoch_seconds_and_milliseconds():
+    assert parse_send_at(1700000000) == 1700000000.0
+    assert parse_send_at(1700000000000) == 1700000000.0
+    assert parse_send_at("1700000000.5") == 1700000000.5
+
+
+def test_parse_send_at_iso():
+    assert parse_send_at("2023-11-14T22:13:20Z") == 1700000000.0
+    assert parse_send_at("2023-11-14T17:13:20-05:00") == 1700000000.0
+    naive = "2023-11-14T22:13:20"
+    assert parse_send_at(naive) == datetime.fromisoformat(naive).timestamp()
+
+
+def test_parse_send_at_datetime():
+    assert parse_send_at(datetime(2023, 11, 14, 22, 13, 20, tzinfo=timezone.utc)) == 1700000000.0
+
+
+def test_parse_send_at_invalid():
+    with pytest.raises(ValueError):
+        parse_send_at("mañana")
+
+
+def _schedule(manager, count, send_at):
+    """Store `count` SCHEDULED rows, one second apart from `send_at`."""
+    ids = manager.add_messages([("51999999999", f"Recordatorio {i}", None, time.time() + 3600, None) for i in range(count)])
+    # Stored as SCHEDULED first, then moved to the wanted time (possibly already due)
+    conn = qm.sqlite3.connect(str(qm.DB_PATH))
+    conn.executemany("UPDATE message_queue SET send_at=? WHERE id=?", [(send_at + i, msg_id) for i, msg_id in enumerate(ids)])
+    conn.commit()
+    conn.close()
+    return ids
+
+
+def test_heap_reloads_past_the_memory_window(manager, monkeypatch):
+    monkeypatch.setattr(scheduler_module, "queue_manager", manager)
+    monkeypatch.setattr(scheduler_module, "HEAP_LIMIT", 2)
+    ids = _schedule(manager, 5, time.time() - 60)
+
+    async def run():
+        scheduler = Scheduler()
+        scheduler.start()
+        assert len(scheduler.heap) == 2
+        assert scheduler.loaded_until is not None
+        for _ in range(100):
+            if manager.get_counters().get('PENDING', 0) == len(ids):
+                break
+            await asyncio.sleep(0.01)
+        scheduler.stop()
+
+    asyncio.run(run())
+    assert manager.get_counters().get('SCHEDULED', 0) == 0
+    assert manager.get_counters().get('PENDING', 0) == 5
+
+
+def test_push_beyond_window_is_left_for_the_next_load(manager, monkeypatch):
+    monkeypatch.setattr(scheduler_module, "queue_manager", manager)
+    monkeypatch.setattr(scheduler_module, "HEAP_LIMIT", 2)
+    later = time.time() + 3600
+    _schedule(manager, 3, later)
+
+    async def run():
+        scheduler = Scheduler()
+        scheduler.start()
+        scheduler.push(999, later + 100)
+        assert 999 not in [msg_id for _, msg_id in scheduler.heap]
+        scheduler.push(998, later - 100)
+        assert scheduler.heap[0] == (later - 100, 998)
+        scheduler.stop()
+
+    asyncio.run(run())